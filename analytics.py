@@ -0,0 +1,153 @@
+"""Usage analytics rolled up into hourly and daily buckets.
+
+Events are counted in memory and added to one hash per hour and per day
+in the state backend on flush, so recording an event is a dict update
+and a query reads one hash per bucket, never raw events. Buckets older
+than the retention limits are deleted on flush.
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Hourly buckets kept (hours) and daily buckets kept (days)
+HOURLY_RETENTION = int(os.getenv("ANALYTICS_HOURLY_RETENTION", str(14 * 24)))
+DAILY_RETENTION = int(os.getenv("ANALYTICS_DAILY_RETENTION", "400"))
+
+HOUR = "hour"
+DAY = "day"
+
+
+class Analytics:
+    """Hourly and daily event counters with bounded retention.
+
+    Hour buckets are numbered in hours since the epoch, day buckets by
+    the date's ordinal in ``tz``. Event names may carry labels, e.g.
+    ``record("sign", "meme", "aries")`` counts the field ``sign:meme:aries``.
+    """
+
+    def __init__(
+        self,
+        backend,
+        tz=None,
+        hourly_retention: int = HOURLY_RETENTION,
+        daily_retention: int = DAILY_RETENTION,
+    ):
+        self.backend = backend
+        self.tz = tz
+        self.retention = {HOUR: hourly_retention, DAY: daily_retention}
+        # (kind, bucket) -> {field: count} not yet written to the backend
+        self.pending = {}
+        # guards pending, which flush swaps from a thread
+        self.lock = threading.Lock()
+        self.known = set()
+        self.hour = self.day = None
+        self.rollover = 0.0
+
+    def _roll(self, now: float):
+        """Recompute the current buckets; called once per hour or local midnight."""
+        local = datetime.datetime.fromtimestamp(now, self.tz)
+        self.hour = int(now // 3600)
+        self.day = local.date().toordinal()
+        midnight = datetime.datetime.combine(
+            local.date() + datetime.timedelta(days=1), datetime.time(), local.tzinfo
+        )
+        self.rollover = min((self.hour + 1) * 3600, midnight.timestamp())
+
+    def record(self, event: str, *labels):
+        now = time.time()
+        if now >= self.rollover:
+            self._roll(now)
+        field = ":".join((event,) + labels) if labels else event
+        with self.lock:
+            for bucket in ((HOUR, self.hour), (DAY, self.day)):
+                counts = self.pending.get(bucket)
+                if counts is None:
+                    counts = self.pending[bucket] = {}
+                counts[field] = counts.get(field, 0) + 1
+
+    @staticmethod
+    def _key(kind: str, bucket: int) -> str:
+        return f"analytics:{kind}:{bucket}"
+
+    def flush(self) -> int:
+        """Add pending counts to the backend buckets and drop expired buckets."""
+        if not self.pending:
+            return 0
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        try:
+            for (kind, bucket), counts in pending.items():
+                self.backend.hincr(self._key(kind, bucket), counts)
+                if (kind, bucket) not in self.known:
+                    self.backend.add_member(f"analytics:{kind}s", bucket)
+                    self.known.add((kind, bucket))
+            self._prune()
+        except Exception:
+            logger.exception("Failed to flush analytics")
+            with self.lock:
+                for bucket, counts in pending.items():
+                    merged = self.pending.setdefault(bucket, {})
+                    for field, amount in counts.items():
+                        merged[field] = merged.get(field, 0) + amount
+            return 0
+        return len(pending)
+
+    def _prune(self):
+        for kind in (HOUR, DAY):
+            current = self.hour if kind == HOUR else self.day
+            cutoff = current - self.retention[kind]
+            index = f"analytics:{kind}s"
+            oldest = self.backend.scan_members(index, None, 100)
+            expired = [bucket for bucket in oldest if bucket <= cutoff]
+            for bucket in expired:
+                self.backend.delete_hash(self._key(kind, bucket))
+                self.backend.remove_member(index, bucket)
+                self.known.discard((kind, bucket))
+
+    def buckets(self, kind: str, count: int):
+        """Return [(bucket, {field: count})] for the last ``count`` buckets, oldest first.
+
+        ``count`` is capped at the retention for ``kind``; unflushed counts
+        are included.
+        """
+        now = time.time()
+        if now >= self.rollover:
+            self._roll(now)
+        current = self.hour if kind == HOUR else self.day
+        count = max(1, min(count, self.retention[kind]))
+        result = []
+        for bucket in range(current - count + 1, current + 1):
+            counts = {
+                field: int(value)
+                for field, value in self.backend.hgetall(self._key(kind, bucket)).items()
+            }
+            with self.lock:
+                unflushed = dict(self.pending.get((kind, bucket), {}))
+            for field, amount in unflushed.items():
+                counts[field] = counts.get(field, 0) + amount
+            result.append((bucket, counts))
+        return result
+
+    def totals(self, kind: str, count: int) -> dict:
+        """Return every field summed over the last ``count`` buckets."""
+        totals = {}
+        for _, counts in self.buckets(kind, count):
+            for field, amount in counts.items():
+                totals[field] = totals.get(field, 0) + amount
+        return totals
+
+    def hours_today(self) -> int:
+        """Return the number of hourly buckets since local midnight, this one included."""
+        now = time.time()
+        local = datetime.datetime.fromtimestamp(now, self.tz)
+        midnight = datetime.datetime.combine(local.date(), datetime.time(), local.tzinfo)
+        return int(now // 3600) - int(midnight.timestamp() // 3600) + 1
+
+    def local_hour(self, bucket: int) -> int:
+        """Return the hour of day in ``tz`` at which an hourly bucket starts."""
+        return datetime.datetime.fromtimestamp(bucket * 3600, self.tz).hour
@@ -0,0 +1,65 @@
+"""Run the reminder broadcast against a fake bot and print the report as JSON.
+
+    python bench_broadcast.py --chats 2000 --rate 100 --bot-limit 80
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+from broadcast import BroadcastCheckpoint, broadcast
+from fake_telegram import FakeBot
+from reminder_store import ReminderStore
+from state_backend import FileBackend
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        backend = FileBackend(db_path, tmp)
+        store = ReminderStore(backend)
+        backend.add_members(store.key, range(1, args.chats + 1))
+        blocked = set(range(1, args.chats + 1, args.blocked_every or args.chats + 1))
+        bot = FakeBot(
+            latency=args.latency,
+            rate_limit=args.bot_limit,
+            retry_after=1,
+            blocked=blocked,
+        )
+        checkpoint = BroadcastCheckpoint(backend, "bench")
+        report = await broadcast(
+            bot,
+            lambda after: store.iter_chats(after=after),
+            "Проверь сегодня свой гороскоп",
+            run_id="bench",
+            checkpoint=checkpoint,
+            on_gone=store.unsubscribe,
+            rate=args.rate,
+            concurrency=args.concurrency,
+        )
+        report["rate_limited"] = bot.rate_limited
+        report["subscribers_left"] = len(store)
+        backend.close()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast benchmark")
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=25)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--bot-limit", type=float, default=None, help="fake Telegram msgs/s limit"
+    )
+    parser.add_argument(
+        "--blocked-every", type=int, default=50, help="every N-th chat blocked the bot"
+    )
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Throughput of edit_text.py in records per second.
+
+Writes a JSONL export and a directory of plain text files with texts of
+mixed lengths, then times the CLI on them inline and with a process pool,
+and the old way of running one ``edit_text.py`` process per file on a
+sample of the files. Prints the results as JSON:
+
+    python bench_edit_text.py --records 200000 --files 2000 --jobs 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from edit_text import default_jobs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, "edit_text.py")
+
+SENTENCE = "Сегодня звёзды советуют не спорить с котом и допить кофе, пока он горячий. "
+
+
+def sample_text(n: int) -> str:
+    # 0.5x to 3x the 1000-character trim limit, with an emoji now and then
+    text = SENTENCE * (7 + n % 35)
+    return text + "✨🌙" if n % 5 == 0 else text
+
+
+def write_inputs(tmp: str, records: int, files: int):
+    jsonl = os.path.join(tmp, "export.jsonl")
+    with open(jsonl, "w", encoding="utf-8") as f:
+        for n in range(records):
+            record = {"id": n, "sign": "aries", "text": sample_text(n)}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    texts = os.path.join(tmp, "texts")
+    os.makedirs(texts)
+    for n in range(files):
+        with open(os.path.join(texts, f"{n:06d}.txt"), "w", encoding="utf-8") as f:
+            f.write(sample_text(n))
+    return jsonl, texts
+
+
+def timed(args, count: int, cwd: str) -> dict:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, SCRIPT, *args],
+        check=True,
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+    )
+    seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 3), "records_per_s": round(count / seconds)}
+
+
+def per_file(paths, cwd: str) -> dict:
+    started = time.perf_counter()
+    for path in paths:
+        subprocess.run(
+            [sys.executable, SCRIPT, path], check=True, cwd=cwd, stdout=subprocess.DEVNULL
+        )
+    seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 3), "records_per_s": round(len(paths) / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="edit_text.py throughput benchmark")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--jobs", type=int, default=max(2, default_jobs()))
+    parser.add_argument("--per-file-sample", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl, texts = write_inputs(tmp, args.records, args.files)
+        out = os.path.join(tmp, "out")
+        jobs = str(args.jobs)
+        sample = sorted(os.listdir(texts))[: args.per_file_sample]
+        result = {
+            "jsonl_inline": timed([jsonl, "--jobs", "1"], args.records, tmp),
+            "jsonl_pool": timed([jsonl, "--jobs", jobs], args.records, tmp),
+            "jsonl_pool_telegram_limit": timed(
+                [jsonl, "--jobs", jobs, "--telegram-limit"], args.records, tmp
+            ),
+            "files_inline": timed(
+                [texts, "--jobs", "1", "--output-dir", out], args.files, tmp
+            ),
+            "files_pool": timed(
+                [texts, "--jobs", jobs, "--output-dir", out], args.files, tmp
+            ),
+            "files_process_per_file": per_file(
+                [os.path.join(texts, name) for name in sample], tmp
+            ),
+            "jobs": args.jobs,
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Handler-level benchmark and load simulation, fully offline.
+
+Drives bot.start, handle_message, reminder_on/off and send_daily_reminders
+with the fakes from fake_telegram, then runs microbenchmarks for
+trim_text, load_cache/get_horoscope and save_json. Everything runs in a
+temporary directory and the results are printed as JSON so runs can be
+compared across commits:
+
+    python bench_handlers.py --users 200 --taps 5 --output bench.json
+
+Flood control is off by default, so the latencies are those of the
+handlers themselves. ``--flood-control`` runs every message through
+bot.admit_update first, as the update processor does, and reports shed
+and coalesced messages separately; combine it with ``--think-time`` to
+model users who pause between taps.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+# Counters for file opens, filled by the audit hook below
+FS_COUNTS = {"reads": 0, "writes": 0}
+# Statement counters for every SQLite connection the bot opens
+DB_COUNTS = {"reads": 0, "writes": 0}
+
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT
+
+
+def _audit(event, args):
+    if event != "open" or not isinstance(args[0], (str, bytes, os.PathLike)):
+        return
+    mode, flags = args[1], args[2]
+    if (mode and any(c in mode for c in "wax+")) or (flags & WRITE_FLAGS):
+        FS_COUNTS["writes"] += 1
+    else:
+        FS_COUNTS["reads"] += 1
+
+
+def _trace_sql(statement):
+    keyword = statement.lstrip().split(" ", 1)[0].upper()
+    if keyword in ("INSERT", "UPDATE", "DELETE", "REPLACE"):
+        DB_COUNTS["writes"] += 1
+    elif keyword == "SELECT":
+        DB_COUNTS["reads"] += 1
+
+
+def _percentiles(samples):
+    if len(samples) < 2:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    q = statistics.quantiles(samples, n=100)
+    return {
+        "p50_ms": round(q[49] * 1000, 3),
+        "p95_ms": round(q[94] * 1000, 3),
+        "p99_ms": round(q[98] * 1000, 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+class LoopMonitor:
+    """Measures how long the event loop was blocked beyond a short sleep."""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        return {
+            "blocked_total_ms": round(sum(self.lags) * 1000, 3),
+            "blocked_max_ms": round(max(self.lags, default=0) * 1000, 3),
+        }
+
+
+async def simulate_users(bot_module, fakes, args):
+    """Run ``args.users`` concurrent users through realistic flows."""
+    fake_bot = fakes.FakeBot(latency=args.send_latency)
+    application = fakes.FakeApplication(fake_bot)
+    sign_labels = list(bot_module.EMOJI_TO_NAME)
+    latencies = {}
+
+    async def call(name, handler, chat_id, text, user_data):
+        update = fakes.FakeUpdate(fake_bot, chat_id, text)
+        context = fakes.FakeContext(application, user_data)
+        if args.flood_control and not await bot_module.admit_update(update):
+            return
+        started = time.perf_counter()
+        await handler(update, context)
+        latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    async def user_flow(chat_id):
+        user_data = {}
+        rng = random.Random(chat_id)
+
+        async def send(name, text):
+            handler = getattr(bot_module, name)
+            await call(name, handler, chat_id, text, user_data)
+            if args.think_time:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_time)
+
+        await send("start", "/start")
+        if rng.random() < 0.3:
+            await send("reminder_on", "/reminder_on")
+        for mode_button in ("Мемный гороскоп", "Нормальный гороскоп"):
+            await send("handle_message", mode_button)
+            for _ in range(args.taps):
+                await send("handle_message", rng.choice(sign_labels))
+            await send("handle_message", "Назад")
+        if rng.random() < 0.1:
+            await send("reminder_off", "/reminder_off")
+
+    FS_COUNTS.update(reads=0, writes=0)
+    DB_COUNTS.update(reads=0, writes=0)
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    monitor = LoopMonitor()
+    monitor.start()
+    flood_before = dict(bot_module.flood.stats)
+    started = time.perf_counter()
+    await asyncio.gather(*(user_flow(chat_id) for chat_id in range(1, args.users + 1)))
+    elapsed = time.perf_counter() - started
+    loop = await monitor.stop()
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    messages = sum(len(samples) for samples in latencies.values())
+    handlers = {
+        name: {"calls": len(samples), **_percentiles(samples)}
+        for name, samples in latencies.items()
+    }
+    all_samples = [s for samples in latencies.values() for s in samples]
+
+    reminder_bot = fakes.FakeBot(latency=args.send_latency)
+    context = fakes.FakeContext(fakes.FakeApplication(reminder_bot))
+    reminder_started = time.perf_counter()
+    await bot_module.send_daily_reminders(context)
+    reminder_elapsed = time.perf_counter() - reminder_started
+
+    return {
+        "users": args.users,
+        "think_time_s": args.think_time,
+        "messages": messages,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(messages / elapsed, 1),
+        "latency": _percentiles(all_samples),
+        "handlers": handlers,
+        "event_loop": loop,
+        "fs_per_message": {
+            "opens_read": round(FS_COUNTS["reads"] / messages, 4),
+            "opens_write": round(FS_COUNTS["writes"] / messages, 4),
+            "db_reads": round(DB_COUNTS["reads"] / messages, 4),
+            "db_writes": round(DB_COUNTS["writes"] / messages, 4),
+        },
+        "memory_growth_kb": round((memory_after - memory_before) / 1024, 1),
+        # rejected messages are counted here, not in messages or latency
+        "flood_control": {
+            name: count - flood_before[name] for name, count in bot_module.flood.stats.items()
+        }
+        if args.flood_control
+        else None,
+        "send_daily_reminders": {
+            "chats": len(reminder_bot.sent),
+            "elapsed_s": round(reminder_elapsed, 3),
+        },
+    }
+
+
+def microbenchmarks(number: int):
+    import bot_utils
+    import horoscope_utils
+    from text_utils import trim_text
+
+    sentence = "Сегодня отличный день, чтобы разрешить себе немного фигни. "
+    texts = {
+        "short": sentence * 5,
+        "medium": sentence * 14,
+        "long": sentence * 40,
+    }
+    results = {}
+    for name, text in texts.items():
+        seconds = timeit.timeit(lambda: trim_text(text), number=number)
+        results[f"trim_text_{name}_us"] = round(seconds / number * 1e6, 3)
+
+    seconds = timeit.timeit(lambda: horoscope_utils.load_cache("meme"), number=number)
+    results["load_cache_us"] = round(seconds / number * 1e6, 3)
+    seconds = timeit.timeit(
+        lambda: horoscope_utils.get_horoscope("aries", "meme"), number=number
+    )
+    results["get_horoscope_us"] = round(seconds / number * 1e6, 3)
+
+    signs = {code: 100 for code in horoscope_utils.ZODIAC_SIGNS.values()}
+    payload = {"starts": 1000, "signs": signs}
+    path = os.path.abspath("bench_save.json")
+    seconds = timeit.timeit(lambda: bot_utils.save_json(path, payload), number=number)
+    results["save_json_us"] = round(seconds / number * 1e6, 3)
+    return results
+
+
+def _seed_cache(horoscope_utils):
+    text = "Сегодня ты как кружка, которую так и не помыл. " * 15
+    horoscopes = {code: text for code in horoscope_utils.ZODIAC_SIGNS.values()}
+    for mode in horoscope_utils.MODES:
+        horoscope_utils.update_day(mode, horoscope_utils.today(), horoscopes)
+
+
+async def run(args):
+    import logging
+
+    import fake_telegram
+    import horoscope_utils
+
+    logging.getLogger().setLevel(logging.WARNING)
+    _seed_cache(horoscope_utils)
+    import bot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    for conn in (bot.backend.conn, bot.followups.conn):
+        conn.set_trace_callback(_trace_sql)
+    sys.addaudithook(_audit)
+
+    result = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "simulation": await simulate_users(bot, fake_telegram, args),
+        "micro": microbenchmarks(args.number),
+    }
+    bot.stats_store.flush()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline handler benchmark")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--taps", type=int, default=5, help="sign taps per mode")
+    parser.add_argument("--send-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="mean seconds between a user's messages"
+    )
+    parser.add_argument(
+        "--flood-control", action="store_true", help="admit messages through bot.admit_update"
+    )
+    parser.add_argument("--number", type=int, default=2000, help="microbenchmark loops")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+        os.environ["BOT_DB"] = os.path.join(tmp, "bench.db")
+        result = asyncio.run(run(args))
+        os.chdir(cwd)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Bot process startup cost, measured with ``python -X importtime``.
+
+Imports ``bot`` in a fresh interpreter and reports the cumulative import
+time, the slowest direct dependencies and whether the OpenAI client was
+loaded. For comparison it also imports ``generate_horoscopes`` on top,
+which the bot process used to load for its first generation run:
+
+    python bench_startup.py --repeat 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(statement: str, env: dict, cwd: str):
+    """Return {module: (self_us, cumulative_us, depth)} for one interpreter run.
+
+    Depth 0 is the statement's own imports, depth 1 what those import.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=cwd,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr[-2000:])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(fields[0]), int(fields[1]), depth)
+    return modules
+
+
+def measure(statement: str, env: dict, cwd: str, repeat: int):
+    runs = [import_times(statement, env, cwd) for _ in range(repeat)]
+    totals = [sum(c for _, c, depth in run.values() if depth == 0) for run in runs]
+    last = runs[-1]
+    top = sorted(
+        ((name, c) for name, (_, c, depth) in last.items() if depth == 1),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:8]
+    return {
+        "import_ms_median": round(statistics.median(totals) / 1000, 1),
+        "modules": len(last),
+        "openai_loaded": "openai" in last,
+        "openai_ms": round(last["openai"][1] / 1000, 1) if "openai" in last else 0.0,
+        "slowest": {name: round(c / 1000, 1) for name, c in top},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot startup import benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            PYTHONPATH=HERE,
+            TELEGRAM_TOKEN="0:bench",
+            BOT_DB=os.path.join(tmp, "bench.db"),
+            STATE_DIR=tmp,
+        )
+        result = {
+            "bot": measure("import bot", env, tmp, args.repeat),
+            "bot_with_generator": measure(
+                "import bot, generate_horoscopes", env, tmp, args.repeat
+            ),
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare the old pretty-printed in-place writes with storage.write_json.
+
+Measures write time, read time and file size for representative state
+payloads and prints the results as JSON:
+
+    python bench_storage.py --number 200
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import storage
+from horoscope_utils import ZODIAC_SIGNS
+
+TEXT = "Сегодня ты как кружка, которую так и не помыл: вроде мелочь, а приятно. " * 13
+
+
+def payloads():
+    day = {"horoscopes": {code: TEXT for code in ZODIAC_SIGNS.values()}, "failed": []}
+    days = {f"2026-10-{n:02d}": day for n in range(16, 20)}
+    return {
+        "horoscope_cache": {
+            "version": 3,
+            "modes": {"meme": {"days": days}, "normal": {"days": days}},
+        },
+        "stats": {
+            "starts": 123456,
+            "signs": {code: 9876 for code in ZODIAC_SIGNS.values()},
+        },
+        "reminders": {"chats": list(range(100000000, 100010000))},
+    }
+
+
+def legacy_write(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def legacy_read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def measure(func, number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return round((time.perf_counter() - started) / number * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="State file write benchmark")
+    parser.add_argument("--number", type=int, default=100)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data in payloads().items():
+            old_path = os.path.join(tmp, f"{name}.legacy.json")
+            new_path = os.path.join(tmp, f"{name}.json")
+            number = args.number
+            results[name] = {
+                "legacy_write_us": measure(lambda: legacy_write(old_path, data), number),
+                "atomic_write_us": measure(
+                    lambda: storage.write_json(new_path, data), number
+                ),
+                "legacy_read_us": measure(lambda: legacy_read(old_path), number),
+                "checked_read_us": measure(
+                    lambda: storage.read_json(new_path, None), number
+                ),
+                "legacy_bytes": os.path.getsize(old_path),
+                "compact_bytes": os.path.getsize(new_path),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
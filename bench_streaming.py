@@ -0,0 +1,81 @@
+"""Time to first horoscope text on a cold cache, batch vs streamed.
+
+Starts stub_openai_server with a per-chunk delay so responses take as
+long to arrive as real completions, then asks for one sign with an empty
+cache: once through get_horoscope_async (waits for the day's run) and
+once through get_horoscope_streaming (streams only that sign). Prints
+the timings as JSON:
+
+    python bench_streaming.py --latency 0.8 --chunk-delay 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from stub_openai_server import start_stub_server
+
+
+async def run(args):
+    import horoscope_utils
+
+    sign = "aries"
+    started = time.perf_counter()
+    await horoscope_utils.get_horoscope_async(sign, "normal")
+    batch = time.perf_counter() - started
+
+    first = []
+
+    async def on_text(text):
+        if not first:
+            first.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await horoscope_utils.get_horoscope_streaming(sign, "meme", on_text=on_text)
+    final = time.perf_counter() - started
+    task = horoscope_utils._regenerations.get(("meme", horoscope_utils.today()))
+    if task is not None:
+        await task
+    filled = time.perf_counter() - started
+    return {
+        "batch_first_text_s": round(batch, 3),
+        "streamed_first_text_s": round(first[0], 3) if first else None,
+        "streamed_final_text_s": round(final, 3),
+        "background_fill_s": round(filled, 3),
+        "missing_after_fill": horoscope_utils.missing_signs(
+            horoscope_utils.get_cached("meme")
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-cache first-text benchmark")
+    parser.add_argument("--latency", type=float, default=0.8)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    server = start_stub_server(latency=args.latency, chunk_delay=args.chunk_delay)
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ.update(
+            OPENAI_API_KEY="stub",
+            OPENAI_BASE_URL="http://%s:%s/v1" % server.server_address,
+            BOT_DB=os.path.join(tmp, "bench.db"),
+            STATE_DIR=tmp,
+            GENERATION_CONCURRENCY=str(args.concurrency),
+            # Measure generation itself, without the worker hop
+            GENERATION_WORKER="inline",
+        )
+        result = asyncio.run(run(args))
+        os.chdir(cwd)
+    server.shutdown()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Load test for update intake: polling vs webhook, both with concurrent processing.
+
+Both modes run a real Application built like the bot's, with
+PerChatUpdateProcessor, against stub_telegram_server instead of the Bot
+API. Webhook mode starts the updater's webhook listener (the one
+run_webhook uses, with the secret token) and POSTs synthetic updates to
+it over keep-alive connections. Polling mode queues the same updates in
+the stub and lets the updater fetch them with getUpdates, each call
+taking --poll-rtt. Handlers sleep for --handler-latency to stand in for
+the Telegram API round-trips of a reply.
+
+    python bench_webhook.py --updates 2000 --chats 200 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import statistics
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from stub_telegram_server import start_stub_server
+from update_processor import PerChatUpdateProcessor
+
+SECRET = "bench-secret"
+PATH = "telegram"
+TEXTS = ["Мемный гороскоп", "♈️Овен", "♌️Лев", "Назад", "♓️Рыбы"]
+
+
+def make_updates(count: int, chats: int):
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = random.randint(1, chats)
+        updates.append(
+            {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+                    "text": random.choice(TEXTS),
+                },
+            }
+        )
+    return updates
+
+
+class Recorder:
+    """Collects handler latencies and checks per-chat ordering."""
+
+    def __init__(self, handler_latency: float, expected: int):
+        self.handler_latency = handler_latency
+        self.expected = expected
+        # update id -> perf_counter time it was handed to the bot
+        self.received = {}
+        self.latencies = []
+        self.last_seen = {}
+        self.order_violations = 0
+        self.done = asyncio.Event()
+
+    async def handle(self, update: Update, context):
+        await asyncio.sleep(self.handler_latency)
+        chat_id = update.effective_chat.id
+        if self.last_seen.get(chat_id, 0) > update.update_id:
+            self.order_violations += 1
+        self.last_seen[chat_id] = update.update_id
+        self.latencies.append(time.perf_counter() - self.received[update.update_id])
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+    def report(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        quantiles = statistics.quantiles(latencies, n=100)
+        return {
+            "updates": len(latencies),
+            "elapsed": round(elapsed, 3),
+            "updates_per_second": round(len(latencies) / elapsed, 1),
+            "latency_p50_ms": round(quantiles[49] * 1000, 2),
+            "latency_p99_ms": round(quantiles[98] * 1000, 2),
+            "order_violations": self.order_violations,
+        }
+
+
+def build_application(stub, recorder: Recorder, concurrency: int):
+    base_url = f"http://127.0.0.1:{stub.server_address[1]}/bot"
+    application = (
+        ApplicationBuilder()
+        .token("0:bench")
+        .base_url(base_url)
+        .concurrent_updates(PerChatUpdateProcessor(concurrency))
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, recorder.handle))
+    return application
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_polling(updates, args) -> dict:
+    stub = start_stub_server(poll_rtt=args.poll_rtt)
+    recorder = Recorder(args.handler_latency, len(updates))
+    application = build_application(stub, recorder, args.concurrency)
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        # Everything is waiting on the server from the start
+        recorder.received = dict.fromkeys((data["update_id"] for data in updates), started)
+        stub.add_updates(updates)
+        await application.updater.start_polling(timeout=1)
+        await recorder.done.wait()
+        elapsed = time.perf_counter() - started
+        await application.updater.stop()
+        await application.stop()
+    stub.shutdown()
+    return recorder.report(elapsed)
+
+
+async def run_webhook(updates, args) -> dict:
+    stub = start_stub_server()
+    recorder = Recorder(args.handler_latency, len(updates))
+    application = build_application(stub, recorder, args.concurrency)
+    port = free_port()
+    async with application:
+        await application.start()
+        # The same listener run_webhook starts in bot.py
+        await application.updater.start_webhook(
+            listen="127.0.0.1",
+            port=port,
+            url_path=PATH,
+            webhook_url=f"http://127.0.0.1:{port}/{PATH}",
+            secret_token=SECRET,
+        )
+
+        async def client(share):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for data in share:
+                body = json.dumps(data).encode()
+                recorder.received[data["update_id"]] = time.perf_counter()
+                writer.write(
+                    (
+                        f"POST /{PATH} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                        f"Content-Type: application/json\r\n"
+                        f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+                        f"Content-Length: {len(body)}\r\n\r\n"
+                    ).encode()
+                    + body
+                )
+                await writer.drain()
+                status = await reader.readline()
+                if b" 200 " not in status:
+                    raise RuntimeError(f"Webhook answered {status!r}")
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    if key.strip().lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+            writer.close()
+
+        started = time.perf_counter()
+        connections = args.connections
+        await asyncio.gather(*(client(updates[i::connections]) for i in range(connections)))
+        await recorder.done.wait()
+        elapsed = time.perf_counter() - started
+        await application.updater.stop()
+        await application.stop()
+    stub.shutdown()
+    return recorder.report(elapsed)
+
+
+async def run(args) -> dict:
+    updates = make_updates(args.updates, args.chats)
+    results = {"webhook": await run_webhook(updates, args)}
+    if not args.skip_polling:
+        results["polling"] = await run_polling(updates, args)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling vs webhook load test")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--handler-latency", type=float, default=0.02)
+    parser.add_argument("--poll-rtt", type=float, default=0.05)
+    parser.add_argument("--skip-polling", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import os
+import sys
 import logging
 import asyncio
 import datetime
+import functools
+import subprocess
+import time
 from dotenv import load_dotenv
 
 from telegram import (
@@ -10,17 +14,28 @@ from telegram import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
 )
+from telegram.error import TelegramError
 from telegram.ext import (
     ApplicationBuilder,
+    Defaults,
     CommandHandler,
     MessageHandler,
     ContextTypes,
     filters,
 )
 
-from horoscope_utils import ZODIAC_SIGNS, get_horoscope
-from text_utils import trim_text
-from bot_utils import load_json, save_json
+import metrics
+import state_backend
+import analytics
+import flood_control
+import generation_jobs
+import horoscope_utils
+from horoscope_utils import ZODIAC_SIGNS, get_horoscope_streaming
+from stats_store import StatsStore
+from reminder_store import ReminderStore
+from broadcast import BroadcastCheckpoint, broadcast
+from followup_scheduler import FollowUpScheduler
+from update_processor import PerChatUpdateProcessor
 
 # Load bot token from .env or environment variable
 load_dotenv()
@@ -33,6 +48,48 @@ if not BOT_TOKEN:
 
 STATS_FILE = os.path.abspath("stats.json")
 REMINDERS_FILE = os.path.abspath("reminders.json")
+# Local database for per-process state such as pending follow-ups
+DB_FILE = state_backend.DB_FILE
+# Seconds a replica holds the scheduler lease; renewed every third of it
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "30"))
+# Seconds between flushes of buffered stats counters to the state backend
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "30"))
+# Global send rate for the daily reminder broadcast (Telegram allows ~30 msg/s)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+REMINDER_TEXT = "Проверь сегодня свой гороскоп"
+# Seconds between a horoscope and the "Поговорить сейчас" follow-up
+FOLLOW_UP_DELAY = float(os.getenv("FOLLOW_UP_DELAY", "60"))
+# Seconds between checks that today's and upcoming horoscopes are generated
+PREGENERATE_INTERVAL = float(os.getenv("PREGENERATE_INTERVAL", "3600"))
+# Worker processes started for GENERATION_WORKER=process
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "1"))
+WORKER_COMMAND = [
+    sys.executable,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate_horoscopes.py"),
+    "--worker",
+]
+# Minimum seconds between edits of a horoscope that is still being streamed
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1"))
+# Seconds a user's mode is answered from the local cache before it is read
+# from the backend again (another replica may have changed it), and the
+# number of users cached
+USER_MODE_TTL = float(os.getenv("USER_MODE_TTL", "60"))
+USER_MODE_CACHE_SIZE = int(os.getenv("USER_MODE_CACHE_SIZE", "100000"))
+
+# "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Updates handled at once; updates from one chat are still processed in order
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+# Public HTTPS URL Telegram posts updates to, e.g. https://example.com/telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Port for the Prometheus /metrics endpoint; disabled when unset
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
 
 # Support legacy button labels with emoji prefixes
 EMOJI_TO_NAME = {
@@ -67,187 +124,563 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def get_keyboard():
-    return ReplyKeyboardMarkup(KEYBOARD_LAYOUT, resize_keyboard=True)
+# Markups are immutable, so they are built once and shared by every reply
+SIGN_MARKUP = ReplyKeyboardMarkup(KEYBOARD_LAYOUT, resize_keyboard=True)
+MODE_MARKUP = ReplyKeyboardMarkup(MODE_KEYBOARD, resize_keyboard=True)
+FOLLOW_UP_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton(
+                "Поговорить сейчас☀️",
+                url="https://t.me/crisis_navigatorbot?start=github_com_kot96kot_crisis_navigator_bot_edit_main_bot_py",
+            )
+        ]
+    ]
+)
 
 
-def get_mode_keyboard():
-    return ReplyKeyboardMarkup(MODE_KEYBOARD, resize_keyboard=True)
+backend = state_backend.get_backend()
+stats_store = StatsStore(backend, legacy_json=STATS_FILE)
+usage = analytics.Analytics(backend, horoscope_utils.TIMEZONE)
 
 
-def get_inline_button():
-    return InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "Поговорить сейчас☀️",
-                    url="https://t.me/crisis_navigatorbot?start=github_com_kot96kot_crisis_navigator_bot_edit_main_bot_py",
-                )
-            ]
-        ]
-    )
+def increment_start():
+    stats_store.increment("starts")
+    usage.record("start")
 
-def load_stats():
-    return load_json(STATS_FILE, {"starts": 0, "signs": {}})
 
+def increment_sign(sign, mode):
+    stats_store.increment(f"sign:{sign}")
+    usage.record("sign", mode, sign)
 
-def save_stats(data):
-    save_json(STATS_FILE, data)
 
+def _flush_counters():
+    stats_store.flush()
+    usage.flush()
+
+
+async def flush_stats(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(_flush_counters)
+
+
+reminder_store = ReminderStore(backend, legacy_json=REMINDERS_FILE)
+reminder_checkpoint = BroadcastCheckpoint(backend, "daily_reminders")
+followups = FollowUpScheduler(DB_FILE, delay=FOLLOW_UP_DELAY)
 
-def increment_start():
-    data = load_stats()
-    data["starts"] = data.get("starts", 0) + 1
-    save_stats(data)
 
+def _collect_followups():
+    yield "bot_followups_pending", "gauge", "Pending follow-up messages", followups.depth
+    yield "bot_followups_coalesced_total", "counter", "Coalesced follow-ups", followups.coalesced
 
-def increment_sign(sign):
-    data = load_stats()
-    signs = data.setdefault("signs", {})
-    signs[sign] = signs.get(sign, 0) + 1
-    save_stats(data)
+
+metrics.register_collector(_collect_followups)
+
+flood = flood_control.FloodControl()
+SLOW_DOWN_TEXT = "Слишком много запросов, подождите несколько секунд."
+
+
+def _collect_flood():
+    yield "bot_flood_tracked_chats", "gauge", "Chats tracked by flood control", flood.tracked
+
+
+metrics.register_dict("bot_flood", flood.stats, "Messages by flood control outcome")
+metrics.register_collector(_collect_flood)
+if horoscope_utils.GENERATION_WORKER != "inline":
+    # OpenAI calls happen in the workers; export their metrics with ours
+    metrics.set_remote_source(generation_jobs.read_metrics)
+
+leadership = {"leader": False}
+
+
+def is_leader() -> bool:
+    """Take or renew the scheduler lease; only its holder runs scheduled jobs."""
+    try:
+        leader = backend.acquire_lease(
+            "scheduler", state_backend.INSTANCE_ID, LEADER_LEASE_TTL
+        )
+    except Exception:
+        logger.exception("Failed to renew scheduler lease")
+        leader = False
+    if leader != leadership["leader"]:
+        logger.info(
+            "%s scheduler leadership as %s",
+            "Acquired" if leader else "Lost",
+            state_backend.INSTANCE_ID,
+        )
+        leadership["leader"] = leader
+    return leader
 
 
-def load_reminders():
-    return load_json(REMINDERS_FILE, {"chats": []})
+def leader_only(job):
+    """Wrap a job so it only runs on the replica holding the scheduler lease."""
 
+    @functools.wraps(job)
+    async def wrapper(context: ContextTypes.DEFAULT_TYPE):
+        if not await asyncio.to_thread(is_leader):
+            logger.debug("Skipping %s, another replica is the leader", job.__name__)
+            return
+        await job(context)
 
-def save_reminders(data):
-    save_json(REMINDERS_FILE, data)
+    return wrapper
+
+
+async def renew_leadership(context: ContextTypes.DEFAULT_TYPE):
+    was_leader = leadership["leader"]
+    if await asyncio.to_thread(is_leader) and not was_leader:
+        # A crashed leader's lease may only expire after this replica started
+        resume_reminders_if_pending(context.application)
+
+
+workers = []
+
+
+def start_workers():
+    """Start or restart the generation worker processes."""
+    for index in range(GENERATION_WORKERS):
+        if index < len(workers) and workers[index].poll() is None:
+            continue
+        if index < len(workers):
+            logger.warning(
+                "Generation worker exited with %s, restarting", workers[index].returncode
+            )
+        process = subprocess.Popen(WORKER_COMMAND)
+        if index < len(workers):
+            workers[index] = process
+        else:
+            workers.append(process)
+        logger.info("Started generation worker pid %d", process.pid)
+
+
+async def supervise_workers(context: ContextTypes.DEFAULT_TYPE):
+    start_workers()
+
+
+def stop_workers():
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# user id -> (mode, monotonic expiry), written through to the backend
+user_modes = {}
+# user id -> mode of an admitted mode switch its handler hasn't applied yet
+pending_modes = {}
+
+
+def cached_user_mode(user_id: int):
+    """Return the user's mode if it is cached locally, without a backend read."""
+    entry = user_modes.get(user_id)
+    if entry is None or entry[1] < time.monotonic():
+        return None
+    return entry[0]
+
+
+def _remember_mode(user_id: int, mode: str):
+    if pending_modes.get(user_id) == mode:
+        del pending_modes[user_id]
+    user_modes.pop(user_id, None)
+    user_modes[user_id] = (mode, time.monotonic() + USER_MODE_TTL)
+    if len(user_modes) > USER_MODE_CACHE_SIZE:
+        # dicts keep insertion order, so this drops the least recently set
+        del user_modes[next(iter(user_modes))]
+
+
+async def get_user_mode(user_id: int) -> str:
+    mode = cached_user_mode(user_id)
+    if mode is None:
+        stored = await asyncio.to_thread(backend.hget, "user_modes", str(user_id))
+        mode = stored or "meme"
+        _remember_mode(user_id, mode)
+    return mode
+
+
+async def set_user_mode(user_id: int, mode: str):
+    # Stored in the backend rather than user_data so any replica can answer
+    _remember_mode(user_id, mode)
+    await asyncio.to_thread(backend.hset, "user_modes", str(user_id), mode)
+
+
+async def reset_user_mode(user_id: int):
+    _remember_mode(user_id, "meme")
+    await asyncio.to_thread(backend.hdel, "user_modes", str(user_id))
+
+
+class StreamingReply:
+    """Reply sent with the first streamed text and edited as more arrives.
+
+    Edits are throttled to one per STREAM_EDIT_INTERVAL; ``finish`` shows
+    the final text, or sends it as a normal reply if nothing was streamed.
+    """
+
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.sent = None
+        self.shown = None
+        self.updated = 0.0
+
+    async def _show(self, text: str):
+        if text == self.shown:
+            return
+        if self.sent is None:
+            self.sent = await self.message.reply_text(text)
+        else:
+            await self.sent.edit_text(text)
+        self.shown = text
+
+    async def update(self, text: str):
+        now = time.monotonic()
+        if self.sent is not None and now - self.updated < self.interval:
+            return
+        self.updated = now
+        await self._show(text + " …")
+
+    async def finish(self, text: str):
+        if self.sent is None:
+            await self.message.reply_text(text)
+            return
+        try:
+            await self._show(text)
+        except TelegramError:
+            logger.exception("Failed to finalize streamed horoscope")
+            await self.message.reply_text(text)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     increment_start()
     await update.message.reply_text(
-        "Выберите тип гороскопа:", reply_markup=get_mode_keyboard()
+        "Выберите тип гороскопа:", reply_markup=MODE_MARKUP
     )
 
 async def reminder_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_reminders()
-    chat_id = update.effective_chat.id
-    if chat_id not in data["chats"]:
-        data["chats"].append(chat_id)
-        save_reminders(data)
+    if await asyncio.to_thread(reminder_store.subscribe, update.effective_chat.id):
+        usage.record("reminder_on")
         await update.message.reply_text("Напоминания включены")
     else:
         await update.message.reply_text("Напоминания уже включены")
 
 
 async def reminder_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_reminders()
-    chat_id = update.effective_chat.id
-    if chat_id in data["chats"]:
-        data["chats"].remove(chat_id)
-        save_reminders(data)
+    if await asyncio.to_thread(reminder_store.unsubscribe, update.effective_chat.id):
+        usage.record("reminder_off")
         await update.message.reply_text("Напоминания отключены")
     else:
         await update.message.reply_text("Напоминания и так выключены")
 
 
 async def send_daily_reminders(context: ContextTypes.DEFAULT_TYPE):
-    data = load_reminders()
-    for chat_id in data.get("chats", []):
-        try:
-            await context.bot.send_message(
-                chat_id=chat_id, text="Проверь сегодня свой гороскоп"
-            )
-        except Exception:
-            logger.exception("Failed to send reminder to %s", chat_id)
+    await broadcast(
+        context.bot,
+        lambda after: reminder_store.iter_chats(after=after),
+        REMINDER_TEXT,
+        run_id=horoscope_utils.today(),
+        checkpoint=reminder_checkpoint,
+        on_gone=reminder_store.unsubscribe,
+        rate=BROADCAST_RATE,
+        concurrency=BROADCAST_CONCURRENCY,
+    )
+
+
+def resume_reminders_if_pending(application):
+    """Restart today's reminder broadcast if a previous leader left it unfinished."""
+    if not reminder_checkpoint.pending(horoscope_utils.today()):
+        return
+    logger.info("Resuming interrupted reminder broadcast")
+    application.job_queue.run_once(
+        metrics.instrument_job(leader_only(send_daily_reminders)), when=0
+    )
+
 
 async def update_all_horoscopes(context: ContextTypes.DEFAULT_TYPE):
-    """Generate horoscopes for both modes once per day."""
+    """Generate any missing horoscopes for today and the days ahead."""
     try:
-        import generate_horoscopes
-
-        generate_horoscopes.generate_all_horoscopes("meme")
-        generate_horoscopes.generate_all_horoscopes("normal")
-        logger.info("Horoscope cache successfully updated")
+        complete = await asyncio.gather(
+            horoscope_utils.pregenerate("meme"),
+            horoscope_utils.pregenerate("normal"),
+        )
+        if all(complete):
+            last_day = horoscope_utils.today(horoscope_utils.AHEAD_DAYS)
+            logger.info("Horoscope cache is complete up to %s", last_day)
+        else:
+            logger.error("Horoscope pre-generation finished with errors")
     except Exception:
         logger.exception("Failed to update daily horoscopes")
 
 
+STATS_USAGE = "Формат: /stats [today|24h|7d] [by mode|by sign|by hour]"
+MODE_NAMES = {"meme": "Мемный", "normal": "Нормальный"}
+SIGN_NAMES = {code: name for name, code in ZODIAC_SIGNS.items()}
+
+
+def parse_stats_query(args):
+    """Parse /stats arguments into (kind, count, group), or None if invalid.
+
+    ``today`` is the current day, ``Nh`` the last N hourly buckets and
+    ``Nd`` the last N daily buckets; ``by hour`` needs an hourly range, so
+    days are converted to the hours since local midnight N - 1 days ago.
+    """
+    words = [word.lower() for word in args]
+    group = None
+    if len(words) >= 2 and words[-2] == "by":
+        group = words[-1]
+        words = words[:-2]
+        if group not in ("mode", "sign", "hour"):
+            return None
+    if len(words) != 1:
+        return None
+    period = words[0]
+    if period == "today":
+        kind, count = analytics.DAY, 1
+    elif period[:-1].isdigit() and period[-1] in "hd":
+        kind = analytics.HOUR if period[-1] == "h" else analytics.DAY
+        count = int(period[:-1])
+    else:
+        return None
+    if group == "hour" and kind == analytics.DAY:
+        kind, count = analytics.HOUR, usage.hours_today() + (count - 1) * 24
+    return kind, count, group
+
+
+def format_stats(kind: str, count: int, group: str = None) -> list:
+    """Return /stats lines for a period, answered from the rollup buckets."""
+    if group == "hour":
+        by_hour = [0] * 24
+        for bucket, counts in usage.buckets(kind, count):
+            by_hour[usage.local_hour(bucket)] += sum(
+                n for field, n in counts.items() if field.startswith("sign:")
+            )
+        return [f"{hour:02d}:00 — {n}" for hour, n in enumerate(by_hour) if n]
+    totals = usage.totals(kind, count)
+    signs = {f: n for f, n in totals.items() if f.startswith("sign:")}
+    lines = [
+        f"Стартов: {totals.get('start', 0)}",
+        f"Гороскопов: {sum(signs.values())}",
+        "Напоминания: +{} / -{}".format(
+            totals.get("reminder_on", 0), totals.get("reminder_off", 0)
+        ),
+    ]
+    if group in ("mode", "sign"):
+        grouped = {}
+        for field, n in signs.items():
+            _, mode, code = field.split(":")
+            if group == "mode":
+                label = MODE_NAMES.get(mode, mode)
+            else:
+                label = SIGN_NAMES.get(code, code)
+            grouped[label] = grouped.get(label, 0) + n
+        for label, n in sorted(grouped.items(), key=lambda item: -item[1]):
+            lines.append(f"{label}: {n}")
+    return lines
+
+
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_USER_ID:
         return
-    data = load_stats()
-    lines = [f"Стартов: {data.get('starts', 0)}"]
+    if context.args:
+        query = parse_stats_query(context.args)
+        if query is None:
+            await update.message.reply_text(STATS_USAGE)
+            return
+        lines = await asyncio.to_thread(format_stats, *query) or ["Нет данных"]
+        await update.message.reply_text("\n".join(lines))
+        return
+    lines = [f"Стартов: {stats_store.get('starts')}"]
     for name, code in ZODIAC_SIGNS.items():
-        count = data.get("signs", {}).get(code, 0)
-        lines.append(f"{name}: {count}")
+        lines.append(f"{name}: {stats_store.get(f'sign:{code}')}")
     await update.message.reply_text("\n".join(lines))
 
 
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_USER_ID:
+        return
+    lines = await asyncio.to_thread(metrics.summary) or ["Нет данных"]
+    await update.message.reply_text("\n".join(lines))
+
+
+async def on_back(update: Update, context: ContextTypes.DEFAULT_TYPE, arg):
+    await reset_user_mode(update.effective_user.id)
+    await update.message.reply_text("Выберите тип гороскопа:", reply_markup=MODE_MARKUP)
+
+
+async def on_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, mode):
+    await set_user_mode(update.effective_user.id, mode)
+    await update.message.reply_text(
+        "Выберите ваш знак зодиака:", reply_markup=SIGN_MARKUP
+    )
+
+
+async def on_sign(update: Update, context: ContextTypes.DEFAULT_TYPE, sign_code):
+    mode = await get_user_mode(update.effective_user.id)
+    # Cached texts are trimmed once when the cache is loaded; on a miss the
+    # sign is streamed into a message that is edited as tokens arrive
+    reply = StreamingReply(update.message)
+    horoscope = await get_horoscope_streaming(sign_code, mode, on_text=reply.update)
+    await reply.finish(horoscope)
+    increment_sign(sign_code, mode)
+    followups.schedule(update.effective_chat.id)
+    await update.message.reply_text(
+        "Выберите ваш знак зодиака:", reply_markup=SIGN_MARKUP
+    )
+
+
+async def on_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE, arg):
+    await update.message.reply_text(
+        "Пожалуйста, выберите знак зодиака из списка.", reply_markup=SIGN_MARKUP
+    )
+
+
+def build_dispatch_table():
+    """Map every accepted message text to its (handler, argument) pair."""
+    table = {
+        "Назад": (on_back, None),
+        "Мемный гороскоп": (on_mode, "meme"),
+        "Нормальный гороскоп": (on_mode, "normal"),
+    }
+    for name, code in ZODIAC_SIGNS.items():
+        table[name] = (on_sign, code)
+    for label, name in EMOJI_TO_NAME.items():
+        table[label] = (on_sign, ZODIAC_SIGNS[name])
+    return table
+
+
+DISPATCH = build_dispatch_table()
+UNKNOWN_ACTION = (on_unknown, None)
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message:
         return
-    text = update.message.text.strip()
-    
-    if text == "Назад":
-        context.user_data.pop("mode", None)
-        await update.message.reply_text(
-            "Выберите тип гороскопа:", reply_markup=get_mode_keyboard()
-        )
-        return
+    handler, arg = DISPATCH.get(update.message.text.strip(), UNKNOWN_ACTION)
+    await handler(update, context, arg)
+
+
+async def admit_update(update: object) -> bool:
+    """Flood control for text messages, run before the update is queued.
+
+    Called by the update processor ahead of the per-chat lock, so overflow
+    never waits behind the chat's earlier updates. The coalescing key uses
+    the mode of the latest admitted mode switch, which may still be queued,
+    or else the locally cached mode: no backend read happens here.
+    """
+    message = getattr(update, "message", None)
+    if message is None or not message.text or message.text.startswith("/"):
+        return True
+    handler, arg = DISPATCH.get(message.text.strip(), UNKNOWN_ACTION)
+    # Repeated taps on the same sign in the same mode share one reply
+    user_id = update.effective_user.id
+    key = None
+    if handler is on_sign:
+        key = (pending_modes.get(user_id) or cached_user_mode(user_id), arg)
+    verdict = flood.check(update.effective_chat.id, key)
+    if verdict == flood_control.ADMIT and handler in (on_mode, on_back):
+        pending_modes[user_id] = arg or "meme"
+    if verdict == flood_control.NOTIFY:
+        try:
+            await message.reply_text(SLOW_DOWN_TEXT)
+        except Exception:
+            logger.exception("Failed to send the slow-down notice")
+    return verdict == flood_control.ADMIT
 
-    if text in ("Мемный гороскоп", "Нормальный гороскоп"):
-        mode = "meme" if text.startswith("Мем") else "normal"
-        context.user_data["mode"] = mode
-        await update.message.reply_text(
-            "Выберите ваш знак зодиака:", reply_markup=get_keyboard()
-        )
-        return
 
-    sign_name = EMOJI_TO_NAME.get(text, text)
-    sign_code = ZODIAC_SIGNS.get(sign_name)
-    if not sign_code:
-        await update.message.reply_text(
-            "Пожалуйста, выберите знак зодиака из списка.", reply_markup=get_keyboard()
-        )
-        return
-    mode = context.user_data.get("mode", "meme")
-    horoscope = get_horoscope(sign_code, mode)
-    horoscope = trim_text(horoscope)
-    await update.message.reply_text(horoscope)
-    increment_sign(sign_code)
-
-    async def delayed_button(chat_id: int):
-        await asyncio.sleep(60)
-        await context.bot.send_message(
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    logger.exception("Exception while handling an update")
+
+
+async def post_init(application):
+    async def send_follow_up(chat_id: int):
+        await application.bot.send_message(
             chat_id=chat_id,
             text="Карманный психолог | Солнышко, держись ☀️",
-            reply_markup=get_inline_button(),
+            reply_markup=FOLLOW_UP_MARKUP,
         )
 
-    context.application.create_task(delayed_button(update.effective_chat.id))
-    await update.message.reply_text(
-        "Выберите ваш знак зодиака:", reply_markup=get_keyboard()
-    )
+    if horoscope_utils.GENERATION_WORKER == "process":
+        start_workers()
+    followups.start(send_follow_up)
+    logger.info("Follow-up scheduler started with %d pending", followups.depth)
+    if is_leader():
+        resume_reminders_if_pending(application)
 
 
-async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
-    logger.exception("Exception while handling an update")
+async def post_shutdown(application):
+    await followups.stop()
+    stop_workers()
+    stats_store.close()
+    usage.flush()
+    if leadership["leader"]:
+        backend.release_lease("scheduler", state_backend.INSTANCE_ID)
+    backend.close()
 
 
 def main():
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
-
+    builder = ApplicationBuilder()
+    if horoscope_utils.TIMEZONE is not None:
+        # Run daily jobs on the same clock as the horoscope day cutover
+        builder = builder.defaults(Defaults(tzinfo=horoscope_utils.TIMEZONE))
+    application = (
+        builder.token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES, admit_update))
+        .build()
+    )
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("reminder_on", reminder_on))
-    application.add_handler(CommandHandler("reminder_off", reminder_off))
-    application.add_handler(CommandHandler("stats", stats))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    instrument = metrics.instrument
+    instrument_job = metrics.instrument_job
+    application.add_handler(CommandHandler("start", instrument(start)))
+    application.add_handler(CommandHandler("reminder_on", instrument(reminder_on)))
+    application.add_handler(CommandHandler("reminder_off", instrument(reminder_off)))
+    application.add_handler(CommandHandler("stats", instrument(stats)))
+    application.add_handler(CommandHandler("perf", instrument(perf)))
+    application.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, instrument(handle_message))
+    )
     application.add_error_handler(error_handler)
 
-    application.job_queue.run_daily(
-        send_daily_reminders, time=datetime.time(hour=9, minute=0)
+    # Broadcast and pre-generation run on one replica only
+    application.job_queue.run_repeating(
+        instrument_job(renew_leadership), interval=LEADER_LEASE_TTL / 3, first=0
     )
     application.job_queue.run_daily(
-        update_all_horoscopes, time=datetime.time(hour=0, minute=1)
+        instrument_job(leader_only(send_daily_reminders)),
+        time=datetime.time(hour=9, minute=0),
+    )
+    application.job_queue.run_repeating(
+        instrument_job(leader_only(update_all_horoscopes)),
+        interval=PREGENERATE_INTERVAL,
+        first=10,
+    )
+    application.job_queue.run_repeating(
+        instrument_job(flush_stats), interval=STATS_FLUSH_INTERVAL
     )
+    if horoscope_utils.GENERATION_WORKER == "process":
+        application.job_queue.run_repeating(
+            instrument_job(supervise_workers), interval=30, first=30
+        )
 
-    logger.info("Bot started")
-    application.run_polling()
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT, METRICS_ADDR)
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise RuntimeError("WEBHOOK_URL must be set when BOT_MODE=webhook.")
+        if not WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET is not set, webhook requests are not verified")
+        logger.info("Bot started in webhook mode on %s:%s", WEBHOOK_LISTEN, WEBHOOK_PORT)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        logger.info("Bot started")
+        application.run_polling()
 
 
 if __name__ == "__main__":
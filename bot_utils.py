@@ -1,23 +1,25 @@
-import json
-import os
 import logging
+import sqlite3
+
+import storage
 
 logger = logging.getLogger(__name__)
 
 
 def load_json(path, default):
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            logger.exception("Failed to load %s", path)
-    return default
+    return storage.read_json(path, default)
 
 
 def save_json(path, data):
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        storage.write_json(path, data)
     except Exception:
         logger.exception("Failed to save %s", path)
+
+
+def open_db(path):
+    """Open a SQLite database in WAL mode for the bot's persistent state."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -0,0 +1,196 @@
+"""Rate-limited, resumable broadcast of one message to many chats."""
+
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket; ``pause`` blocks every caller after a flood error."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastCheckpoint:
+    """Progress of a named broadcast, stored in the state backend.
+
+    A run is identified by ``run_id`` (the date for daily reminders); the
+    last chat id of every completed batch is saved so that a restarted
+    run, possibly on another replica, skips the chats already handled.
+    """
+
+    def __init__(self, backend, name: str):
+        self.backend = backend
+        self.name = name
+
+    def _state(self) -> dict:
+        raw = self.backend.hget("broadcasts", self.name)
+        return json.loads(raw) if raw else {}
+
+    def load(self, run_id: str):
+        """Return (last_chat_id, done) for the run, or (None, False) if it's new."""
+        state = self._state()
+        if state.get("run_id") != run_id:
+            return None, False
+        return state.get("last_chat_id"), bool(state.get("done"))
+
+    def save(self, run_id: str, last_chat_id, done: bool = False):
+        state = {"run_id": run_id, "last_chat_id": last_chat_id, "done": done}
+        self.backend.hset("broadcasts", self.name, json.dumps(state))
+
+    def pending(self, run_id: str) -> bool:
+        """Return True if the run was started but not finished."""
+        state = self._state()
+        return state.get("run_id") == run_id and not state.get("done")
+
+
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    delay = exc.retry_after
+    if isinstance(delay, datetime.timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+def _is_gone(exc: Exception) -> bool:
+    """Return True if the chat can never receive messages from the bot again."""
+    if isinstance(exc, Forbidden):
+        return True
+    return isinstance(exc, BadRequest) and "chat not found" in str(exc).lower()
+
+
+async def broadcast(
+    bot,
+    iter_chats,
+    text: str,
+    *,
+    run_id: str,
+    checkpoint: BroadcastCheckpoint = None,
+    on_gone=None,
+    rate: float = 25,
+    per_chat_interval: float = 1.0,
+    concurrency: int = 20,
+    batch_size: int = 200,
+    max_retries: int = 3,
+) -> dict:
+    """Send ``text`` to every chat yielded by ``iter_chats(after)``.
+
+    ``iter_chats`` must yield chat ids in ascending order starting after the
+    given id (see ReminderStore.iter_chats). Sends share a global token
+    bucket of ``rate`` messages per second; a RetryAfter pauses the bucket
+    for everyone. Chats that blocked the bot or no longer exist are passed
+    to ``on_gone``. Returns a report with counts, elapsed time and
+    throughput.
+    """
+    report = {"sent": 0, "gone": 0, "failed": 0, "retries": 0, "skipped": False}
+    after, done = (None, False)
+    if checkpoint is not None:
+        after, done = await asyncio.to_thread(checkpoint.load, run_id)
+    if done:
+        logger.info("Broadcast %s already completed", run_id)
+        report["skipped"] = True
+        return report
+    if after is not None:
+        logger.info("Resuming broadcast %s after chat %s", run_id, after)
+
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    last_sent = {}
+
+    async def send(chat_id):
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                wait = last_sent.get(chat_id, 0) + per_chat_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await bucket.acquire()
+                last_sent[chat_id] = time.monotonic()
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text)
+                    report["sent"] += 1
+                    return
+                except RetryAfter as exc:
+                    delay = _retry_after_seconds(exc)
+                    logger.warning("Flood limit hit, pausing sends for %ss", delay)
+                    bucket.pause(delay)
+                except (Forbidden, BadRequest) as exc:
+                    if not _is_gone(exc):
+                        logger.warning("Failed to send to %s: %s", chat_id, exc)
+                        report["failed"] += 1
+                        return
+                    report["gone"] += 1
+                    if on_gone is not None:
+                        await asyncio.to_thread(on_gone, chat_id)
+                    return
+                except NetworkError:
+                    await asyncio.sleep(2 ** attempt)
+                except Exception:
+                    logger.exception("Failed to send reminder to %s", chat_id)
+                    report["failed"] += 1
+                    return
+                report["retries"] += 1
+            logger.error("Giving up on %s after %d retries", chat_id, max_retries)
+            report["failed"] += 1
+
+    started = time.perf_counter()
+    chats = iter_chats(after)
+    last = after
+    while True:
+        # Chat ids and checkpoints are read and written in a thread, one
+        # batch at a time, so backend round trips never block the loop
+        batch = await asyncio.to_thread(list, itertools.islice(chats, batch_size))
+        if not batch:
+            break
+        await asyncio.gather(*(send(c) for c in batch))
+        last = batch[-1]
+        if checkpoint is not None and len(batch) == batch_size:
+            await asyncio.to_thread(checkpoint.save, run_id, last)
+        last_sent.clear()
+    if checkpoint is not None:
+        await asyncio.to_thread(checkpoint.save, run_id, last, True)
+
+    elapsed = time.perf_counter() - started
+    report["elapsed"] = round(elapsed, 3)
+    report["throughput"] = round(report["sent"] / elapsed, 1) if elapsed else 0.0
+    logger.info(
+        "Broadcast %s finished in %.1fs: %d sent (%.1f msg/s), %d gone, %d failed",
+        run_id,
+        elapsed,
+        report["sent"],
+        report["throughput"],
+        report["gone"],
+        report["failed"],
+    )
+    return report
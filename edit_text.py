@@ -1,16 +1,280 @@
+"""Trim texts with text_utils.trim_text from the command line.
+
+With no arguments or ``-`` the text is read from stdin; a single file is
+trimmed and written to stdout as before. Inputs may also be directories
+(every file below them), glob patterns and JSONL/NDJSON files, whose
+``--field`` (a dotted path such as ``horoscopes.aries``) is trimmed in
+each record:
+
+    python edit_text.py export.jsonl --field text --jobs 8 > trimmed.jsonl
+    python edit_text.py 'texts/**/*.txt' --output-dir trimmed/
+    python edit_text.py texts/ --telegram-limit
+
+Records are streamed and trimmed in batches across a process pool with
+a bounded number of batches in flight, so memory stays flat however
+large the input is and output keeps the input order. Input that fits in
+a single batch is trimmed inline without starting the pool. Several
+plain text files are written to ``--output-dir`` or, without it, to
+stdout as JSONL records ``{"path": ..., "text": ...}``.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import functools
+import glob
+import itertools
+import json
+import os
 import sys
-from text_utils import trim_text
 
+from text_utils import TELEGRAM_MESSAGE_LIMIT, fit_telegram, trim_text
 
-def main():
-    if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+# Records handed to a worker at once, and batches in flight per worker
+BATCH_SIZE = 1000
+WINDOW_PER_JOB = 4
+
+
+def expand_inputs(inputs):
+    """Yield file paths for files, directories (recursively) and glob patterns."""
+    for item in inputs:
+        if item == '-':
+            yield item
+        elif os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        elif glob.has_magic(item):
+            matches = sorted(
+                p for p in glob.glob(item, recursive=True) if os.path.isfile(p)
+            )
+            if not matches:
+                raise FileNotFoundError(f'no files match {item}')
+            yield from matches
+        else:
+            yield item
+
+
+def is_jsonl(path: str) -> bool:
+    return path.lower().endswith(JSONL_SUFFIXES)
+
+
+def make_editor(telegram_limit: int = None):
+    """Return the text transformation: trim_text, or a cut to Telegram's limit."""
+    if telegram_limit:
+        return lambda text: fit_telegram(text, telegram_limit)
+    return trim_text
+
+
+def _get_field(record, path):
+    for name in path:
+        if not isinstance(record, dict) or name not in record:
+            return None
+        record = record[name]
+    return record
+
+
+def _set_field(record, path, value):
+    for name in path[:-1]:
+        record = record[name]
+    record[path[-1]] = value
+
+
+def edit_lines(lines, field: str, telegram_limit: int = None):
+    """Trim ``field`` in each JSONL line; lines without a string there pass through.
+
+    Returns (output text, records, records changed, records passed through).
+    """
+    edit = make_editor(telegram_limit)
+    path = field.split('.')
+    output, records, changed, skipped = [], 0, 0, 0
+    for line in lines:
+        if not line.strip():
+            output.append(line)
+            continue
+        records += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        text = _get_field(record, path)
+        if not isinstance(text, str):
+            output.append(line)
+            skipped += 1
+            continue
+        edited = edit(text)
+        if edited != text:
+            _set_field(record, path, edited)
+            line = json.dumps(record, ensure_ascii=False) + '\n'
+            changed += 1
+        output.append(line)
+    return ''.join(output), records, changed, skipped
+
+
+def edit_files(paths, telegram_limit: int = None):
+    """Read and trim whole text files; returns [(path, text)] and the change count."""
+    edit = make_editor(telegram_limit)
+    output, changed = [], 0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
             text = f.read()
-    else:
+        edited = edit(text)
+        changed += edited != text
+        output.append((path, edited))
+    return output, changed
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ordered_map(fn, batches, executor=None, window: int = 1):
+    """Yield fn(batch) in input order, keeping at most ``window`` batches in flight.
+
+    Without an executor the batches run inline in this process.
+    """
+    if executor is None:
+        for batch in batches:
+            yield fn(batch)
+        return
+    pending = collections.deque()
+    for batch in batches:
+        pending.append(executor.submit(fn, batch))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def read_lines(paths):
+    """Stream the lines of every JSONL input, stdin included."""
+    for path in paths:
+        if path == '-':
+            yield from sys.stdin
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from f
+
+
+def _output_path(output_dir: str, path: str) -> str:
+    relative = os.path.relpath(path)
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(path)
+    return os.path.join(output_dir, relative)
+
+
+def run(args, out=sys.stdout) -> dict:
+    """Trim every input and write the results; returns record counts."""
+    paths = list(expand_inputs(args.inputs or ['-']))
+    files = [p for p in paths if p != '-']
+    jsonl = args.jsonl or bool(files and all(is_jsonl(p) for p in files))
+    if not jsonl and any(is_jsonl(p) for p in files):
+        raise ValueError('cannot mix JSONL and plain text inputs')
+    if not jsonl and files and len(files) != len(paths):
+        raise ValueError('stdin can only be combined with JSONL inputs')
+    limit = args.telegram_limit
+    stats = {'records': 0, 'changed': 0, 'skipped': 0}
+
+    if not jsonl and paths == ['-']:
+        # a single text on stdin, as the tool always worked
         text = sys.stdin.read()
-    result = trim_text(text)
-    sys.stdout.write(result)
+        edited = make_editor(limit)(text)
+        out.write(edited)
+        stats.update(records=1, changed=int(edited != text))
+        return stats
+
+    if jsonl:
+        work = functools.partial(edit_lines, field=args.field, telegram_limit=limit)
+        batches = batched(read_lines(paths), args.batch_size)
+    else:
+        work = functools.partial(edit_files, telegram_limit=limit)
+        # spread several files over the workers even below --batch-size
+        size = min(args.batch_size, -(-len(paths) // max(args.jobs, 1)))
+        batches = batched(paths, size)
+    # a pool only pays off with more than one batch to hand out
+    head = list(itertools.islice(batches, 2))
+    batches = itertools.chain(head, batches)
+    executor = None
+    if args.jobs > 1 and len(head) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(args.jobs)
+    window = args.jobs * WINDOW_PER_JOB
+    try:
+        if jsonl:
+            for text, records, changed, skipped in ordered_map(
+                work, batches, executor, window
+            ):
+                out.write(text)
+                stats['records'] += records
+                stats['changed'] += changed
+                stats['skipped'] += skipped
+            return stats
+
+        single = len(paths) == 1 and not args.output_dir
+        for results, changed in ordered_map(work, batches, executor, window):
+            for path, text in results:
+                if args.output_dir:
+                    target = _output_path(args.output_dir, path)
+                    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                    with open(target, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                elif single:
+                    out.write(text)
+                else:
+                    record = {'path': path, 'text': text}
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            stats['records'] += len(results)
+            stats['changed'] += changed
+        return stats
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def default_jobs() -> int:
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Trim texts with trim_text')
+    parser.add_argument('inputs', nargs='*', help='files, directories, globs or - for stdin')
+    parser.add_argument('--field', default='text', help='dotted JSONL field to trim')
+    parser.add_argument('--jsonl', action='store_true', help='treat all inputs as JSONL')
+    parser.add_argument(
+        '--jobs', type=int, default=default_jobs(), help='worker processes, 1 to run inline'
+    )
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        '--telegram-limit',
+        type=int,
+        nargs='?',
+        const=TELEGRAM_MESSAGE_LIMIT,
+        help='instead of the 1000-character trim, cut to this many UTF-16 units '
+        f'({TELEGRAM_MESSAGE_LIMIT} without a value)',
+    )
+    parser.add_argument('--output-dir', help='write trimmed plain text files here')
+    parser.add_argument('--summary', action='store_true', help='print record counts to stderr')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    try:
+        stats = run(args)
+    except (OSError, ValueError) as exc:
+        sys.exit(f'edit_text: {exc}')
+    if args.summary:
+        sys.stderr.write(json.dumps(stats) + '\n')
 
 
-if __name__ == "__main__":
+if __name__ == '__main__':
     main()
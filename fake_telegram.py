@@ -0,0 +1,128 @@
+"""Offline stand-ins for the Telegram objects the bot talks to."""
+
+import asyncio
+import itertools
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+
+class FakeBot:
+    """Records sent messages and simulates Telegram's delivery errors.
+
+    ``rate_limit`` is the number of messages per second accepted before
+    RetryAfter is raised, ``blocked`` chats raise Forbidden and ``missing``
+    chats raise BadRequest("Chat not found").
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit: float = None,
+        retry_after: int = 1,
+        blocked=(),
+        missing=(),
+    ):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.blocked = set(blocked)
+        self.missing = set(missing)
+        self.sent = []
+        self.edits = []
+        self.rate_limited = 0
+        self.message_ids = itertools.count(1)
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def _check_rate(self):
+        if self.rate_limit is None:
+            return
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        if self._window_count > self.rate_limit:
+            self.rate_limited += 1
+            raise RetryAfter(self.retry_after)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id in self.missing:
+            raise BadRequest("Chat not found")
+        self._check_rate()
+        self.sent.append((chat_id, text, kwargs))
+        message = FakeMessage(self, chat_id, text)
+        message.message_id = next(self.message_ids)
+        return message
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.edits.append((chat_id, message_id, text))
+        return True
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.type = "private"
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.is_bot = False
+
+
+class FakeMessage:
+    """Message whose replies go to FakeBot.send_message."""
+
+    def __init__(self, bot, chat_id, text):
+        self.bot = bot
+        self.chat = FakeChat(chat_id)
+        self.from_user = FakeUser(chat_id)
+        self.text = text
+        self.message_id = 0
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(chat_id=self.chat.id, text=text, **kwargs)
+
+    async def edit_text(self, text, **kwargs):
+        await self.bot.edit_message_text(text, self.chat.id, self.message_id, **kwargs)
+        self.text = text
+        return self
+
+
+class FakeUpdate:
+    def __init__(self, bot, chat_id, text):
+        self.message = FakeMessage(bot, chat_id, text)
+        self.effective_chat = self.message.chat
+        self.effective_user = self.message.from_user
+        self.effective_message = self.message
+
+
+class FakeApplication:
+    def __init__(self, bot):
+        self.bot = bot
+        self.tasks = set()
+
+    def create_task(self, coroutine, **kwargs):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+
+class FakeContext:
+    """Handler context with per-user ``user_data``, as PTB provides."""
+
+    def __init__(self, application, user_data=None, args=None):
+        self.application = application
+        self.bot = application.bot
+        self.user_data = {} if user_data is None else user_data
+        self.args = args or []
@@ -0,0 +1,117 @@
+"""Per-chat admission control for incoming messages."""
+
+import collections
+import os
+import time
+
+# Messages a chat may have handled per sliding window (seconds)
+FLOOD_MAX_REQUESTS = int(os.getenv("FLOOD_MAX_REQUESTS", "8"))
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", "10"))
+# Repeats of the same request within this many seconds get no new reply
+COALESCE_SECONDS = float(os.getenv("COALESCE_SECONDS", "10"))
+# Chats idle this long (seconds) are forgotten; the table never exceeds FLOOD_MAX_CHATS
+FLOOD_IDLE_TTL = float(os.getenv("FLOOD_IDLE_TTL", "600"))
+FLOOD_MAX_CHATS = int(os.getenv("FLOOD_MAX_CHATS", "100000"))
+
+ADMIT = "admit"
+COALESCED = "coalesced"
+# Over the limit: NOTIFY for the first message of a burst, SHED for the rest
+NOTIFY = "notify"
+SHED = "shed"
+
+
+class _ChatState:
+    __slots__ = ("admitted", "recent", "notified", "last_seen")
+
+    def __init__(self):
+        # monotonic times of admitted messages inside the window
+        self.admitted = collections.deque()
+        # request key -> monotonic time it was last admitted
+        self.recent = {}
+        self.notified = False
+        self.last_seen = 0.0
+
+
+class FloodControl:
+    """Sliding-window rate limit and duplicate coalescing per chat.
+
+    ``check`` is a few dict and deque operations, so overflow is dropped
+    before any handler, backend or Telegram work happens. Chats are kept
+    in least recently seen order and evicted once idle, which bounds
+    memory by the number of active chats.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = FLOOD_MAX_REQUESTS,
+        window: float = FLOOD_WINDOW,
+        coalesce_seconds: float = COALESCE_SECONDS,
+        idle_ttl: float = FLOOD_IDLE_TTL,
+        max_chats: int = FLOOD_MAX_CHATS,
+    ):
+        self.max_requests = max_requests
+        self.window = window
+        self.coalesce_seconds = coalesce_seconds
+        self.idle_ttl = max(idle_ttl, window, coalesce_seconds)
+        self.max_chats = max_chats
+        self.chats = collections.OrderedDict()
+        self.stats = {"admitted": 0, "coalesced": 0, "shed": 0, "notices": 0, "evicted": 0}
+
+    @property
+    def tracked(self) -> int:
+        return len(self.chats)
+
+    def check(self, chat_id, key=None, now: float = None) -> str:
+        """Return ADMIT, COALESCED, NOTIFY or SHED for a message from the chat.
+
+        ``key`` identifies the request for coalescing, e.g. ``(mode, sign)``;
+        messages without one are only rate limited. Coalesced repeats do
+        not count against the limit.
+        """
+        if now is None:
+            now = time.monotonic()
+        state = self.chats.get(chat_id)
+        if state is None:
+            state = self.chats[chat_id] = _ChatState()
+        else:
+            self.chats.move_to_end(chat_id)
+        state.last_seen = now
+        self._evict(now)
+
+        if key is not None:
+            seen = state.recent.get(key)
+            if seen is not None and now - seen < self.coalesce_seconds:
+                self.stats["coalesced"] += 1
+                return COALESCED
+
+        admitted = state.admitted
+        while admitted and admitted[0] <= now - self.window:
+            admitted.popleft()
+        if len(admitted) >= self.max_requests:
+            self.stats["shed"] += 1
+            if state.notified:
+                return SHED
+            state.notified = True
+            self.stats["notices"] += 1
+            return NOTIFY
+
+        admitted.append(now)
+        state.notified = False
+        if key is not None:
+            if len(state.recent) > 8:
+                cutoff = now - self.coalesce_seconds
+                state.recent = {k: t for k, t in state.recent.items() if t > cutoff}
+            state.recent[key] = now
+        self.stats["admitted"] += 1
+        return ADMIT
+
+    def _evict(self, now: float):
+        """Drop idle chats from the least recently seen end."""
+        chats = self.chats
+        cutoff = now - self.idle_ttl
+        while chats:
+            chat_id, state = next(iter(chats.items()))
+            if state.last_seen > cutoff and len(chats) <= self.max_chats:
+                return
+            del chats[chat_id]
+            self.stats["evicted"] += 1
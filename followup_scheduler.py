@@ -0,0 +1,157 @@
+"""Durable scheduler for the delayed follow-up message."""
+
+import asyncio
+import heapq
+import logging
+import time
+
+from bot_utils import open_db
+
+logger = logging.getLogger(__name__)
+
+
+class FollowUpScheduler:
+    """At most one pending follow-up per chat, drained by a single worker task.
+
+    Pending entries live in a heap ordered by due time and in the bot
+    database, so they survive restarts. ``schedule`` only touches memory;
+    changes are written to the database in batches every
+    ``flush_interval`` seconds from a thread, so a crash loses at most the
+    taps of the last interval. Repeated taps while a follow-up is pending
+    are coalesced into it.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        delay: float = 60,
+        max_in_flight: int = 20,
+        flush_interval: float = 1.0,
+    ):
+        self.delay = delay
+        self.flush_interval = flush_interval
+        self.conn = open_db(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS followups ("
+                "chat_id INTEGER PRIMARY KEY, due REAL NOT NULL)"
+            )
+        self.pending = dict(self.conn.execute("SELECT chat_id, due FROM followups"))
+        self.heap = [(due, chat_id) for chat_id, due in self.pending.items()]
+        heapq.heapify(self.heap)
+        # chat id -> due time to save, or None to delete; not yet written
+        self.dirty = {}
+        self.coalesced = 0
+        self.max_in_flight = max_in_flight
+        self.task = None
+        self.flusher = None
+        self.wakeup = None
+        self.stopping = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    def schedule(self, chat_id) -> bool:
+        """Queue a follow-up for the chat; return False if one is already pending."""
+        if chat_id in self.pending:
+            self.coalesced += 1
+            return False
+        due = time.time() + self.delay
+        self.pending[chat_id] = due
+        self.dirty[chat_id] = due
+        heapq.heappush(self.heap, (due, chat_id))
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return True
+
+    def start(self, send):
+        """Start the worker; ``send`` is an async callable taking a chat id."""
+        self.wakeup = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self._run(send))
+        self.flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.flusher is not None:
+            # Let the flusher finish its write and save the rest
+            self.stopping.set()
+            await self.flusher
+        else:
+            await self.flush()
+        self.conn.close()
+
+    def _write(self, batch: dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO followups (chat_id, due) VALUES (?, ?)",
+                [(chat_id, due) for chat_id, due in batch.items() if due is not None],
+            )
+            self.conn.executemany(
+                "DELETE FROM followups WHERE chat_id = ?",
+                [(chat_id,) for chat_id, due in batch.items() if due is None],
+            )
+
+    async def flush(self) -> int:
+        """Write the changes made since the last flush; return how many."""
+        if not self.dirty:
+            return 0
+        batch, self.dirty = self.dirty, {}
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception:
+            logger.exception("Failed to save %d follow-up changes", len(batch))
+            # Changes made during the write are newer than the batch
+            batch.update(self.dirty)
+            self.dirty = batch
+            return 0
+        return len(batch)
+
+    async def _flush_periodically(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def _deliver(self, send, chat_id, slots):
+        try:
+            await send(chat_id)
+        except Exception:
+            logger.exception("Failed to send follow-up to %s", chat_id)
+        finally:
+            slots.release()
+
+    async def _run(self, send):
+        slots = asyncio.Semaphore(self.max_in_flight)
+        in_flight = set()
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            due, chat_id = self.heap[0]
+            wait = due - time.time()
+            if wait > 0:
+                # asyncio.wait, unlike wait_for, never swallows a cancel that
+                # arrives as the wakeup is set, so stop() can't hang here
+                waiter = asyncio.ensure_future(self.wakeup.wait())
+                try:
+                    await asyncio.wait((waiter,), timeout=wait)
+                finally:
+                    waiter.cancel()
+                continue
+            heapq.heappop(self.heap)
+            del self.pending[chat_id]
+            self.dirty[chat_id] = None
+            await slots.acquire()
+            task = asyncio.create_task(self._deliver(send, chat_id, slots))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
@@ -1,10 +1,31 @@
+import json
 import logging
-import datetime
 import os
+import time
+import random
+import asyncio
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
 
-from horoscope_utils import ZODIAC_SIGNS, load_cache, save_cache
+import metrics
+import state_backend
+import generation_jobs
+import horoscope_utils
+from horoscope_utils import (
+    ZODIAC_SIGNS,
+    get_day,
+    load_cache,
+    missing_signs,
+    today,
+    update_day_async,
+)
+from response_cache import ResponseCache, make_key
 from text_utils import trim_text
 
 logging.basicConfig(
@@ -15,11 +36,37 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError(
-        "OPENAI_API_KEY environment variable not set. Add it to your .env file."
-    )
-client = OpenAI(api_key=OPENAI_API_KEY)
+
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+TEMPERATURE = 0.8
+# Number of signs requested from the API at the same time
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+# Per-request timeout in seconds
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "90"))
+# Retries per sign after the first attempt
+GENERATION_RETRIES = int(os.getenv("GENERATION_RETRIES", "4"))
+# Base delay in seconds for exponential backoff between retries
+GENERATION_BACKOFF = float(os.getenv("GENERATION_BACKOFF", "1"))
+# trim_text never keeps more than this many characters, so a stream can stop there
+STREAM_STOP_CHARS = 1000
+# Generation jobs one worker process runs at the same time
+WORKER_JOBS = int(os.getenv("GENERATION_WORKER_JOBS", "4"))
+# Seconds between partial texts a worker publishes while streaming
+PARTIAL_INTERVAL = float(os.getenv("GENERATION_PARTIAL_INTERVAL", "0.5"))
+# Seconds between worker metrics snapshots for the bot's /metrics and /perf
+METRICS_PUBLISH_INTERVAL = float(os.getenv("GENERATION_METRICS_INTERVAL", "10"))
+
+SIGN_NAMES = {code: name for name, code in ZODIAC_SIGNS.items()}
+
+responses = ResponseCache(state_backend.get_backend())
+metrics.register_dict("openai_response_cache", responses.stats, "Cached OpenAI responses")
+
+RETRYABLE_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+)
 
 PROMPT_TEMPLATE = (
     "Ты — digital-друг, который пишет самый смешной, мемный, но очень тёплый и "
@@ -65,48 +112,351 @@ EMOTIONAL_HOROSCOPE_PROMPT = (
 )
 
 
-def generate_all_horoscopes(mode: str = "meme"):
-    """Generate fresh horoscopes for all signs and save them to cache."""
-    logger.info("Starting horoscope generation")
-    cache = load_cache(mode)
-    horoscopes = cache.get("horoscopes", {})
-    errors = False
-    template = PROMPT_TEMPLATE if mode == "meme" else EMOTIONAL_HOROSCOPE_PROMPT
-    for name, code in ZODIAC_SIGNS.items():
-        prompt = template.format(sign=name)
-        logger.debug("Prompt for %s: %s", name, prompt)
+def _client() -> AsyncOpenAI:
+    """Create the OpenAI client, failing only when generation is attempted."""
+    if not OPENAI_API_KEY:
+        raise RuntimeError(
+            "OPENAI_API_KEY environment variable not set. Add it to your .env file."
+        )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+
+def _retry_delay(exc, attempt: int) -> float:
+    """Return how long to wait before the next attempt."""
+    response = getattr(exc, "response", None)
+    if response is not None:
+        headers = response.headers
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+    delay = GENERATION_BACKOFF * 2 ** attempt
+    return delay + random.uniform(0, delay / 2)
+
+
+async def _with_retries(name: str, attempt):
+    """Run ``attempt()``, retrying transient errors with backoff."""
+    for number in range(GENERATION_RETRIES + 1):
+        started = time.perf_counter()
         try:
             logger.info("Requesting horoscope for %s", name)
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000,
-                temperature=0.8,
+            result = await attempt()
+            metrics.OPENAI_SECONDS.observe(time.perf_counter() - started)
+            return result
+        except RETRYABLE_ERRORS as exc:
+            metrics.OPENAI_SECONDS.observe(time.perf_counter() - started)
+            if number == GENERATION_RETRIES:
+                metrics.OPENAI_ERRORS.inc()
+                raise
+            metrics.OPENAI_RETRIES.inc()
+            delay = _retry_delay(exc, number)
+            logger.warning(
+                "Request for %s failed (%s), retrying in %.1fs",
+                name,
+                type(exc).__name__,
+                delay,
             )
-            text = response.choices[0].message.content.strip()
-            text = trim_text(text)
-            logger.info("Received %s: %s", name, text[:100])
-        except Exception:
-            logger.exception("Error generating %s with key %s", code, OPENAI_API_KEY[:6])
-            text = horoscopes.get(code) or "Сегодня гороскоп не найден, попробуйте позже."
-            errors = True
-        horoscopes[code] = text
-    date = datetime.date.today().isoformat()
-    if errors:
-        date = cache.get("date", "")
-    data = {
-        "date": date,
-        "horoscopes": horoscopes,
-    }
+            await asyncio.sleep(delay)
+
+
+def _count_tokens(usage):
+    if usage is not None:
+        metrics.OPENAI_TOKENS.inc(usage.prompt_tokens, "prompt")
+        metrics.OPENAI_TOKENS.inc(usage.completion_tokens, "completion")
+
+
+async def _request_horoscope(client, name: str, prompt: str) -> str:
+    """Request one horoscope, retrying transient errors with backoff."""
+
+    async def attempt():
+        response = await client.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+            temperature=TEMPERATURE,
+            timeout=GENERATION_TIMEOUT,
+        )
+        _count_tokens(response.usage)
+        return response.choices[0].message.content.strip()
+
+    return await _with_retries(name, attempt)
+
+
+async def _stream_horoscope(client, name: str, prompt: str, on_text=None) -> str:
+    """Request one horoscope with the streaming API.
+
+    ``on_text`` is awaited with the text received so far after every
+    chunk; a retry starts the text over. The stream is closed once
+    STREAM_STOP_CHARS characters have arrived.
+    """
+
+    async def attempt():
+        started = time.perf_counter()
+        text = ""
+        stream = await client.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+            temperature=TEMPERATURE,
+            timeout=GENERATION_TIMEOUT,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async with stream:
+            async for chunk in stream:
+                _count_tokens(chunk.usage)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not text:
+                    metrics.OPENAI_FIRST_TOKEN_SECONDS.observe(
+                        time.perf_counter() - started
+                    )
+                text += delta
+                if on_text is not None:
+                    try:
+                        await on_text(text)
+                    except Exception:
+                        logger.exception("Failed to show partial horoscope for %s", name)
+                if len(text) > STREAM_STOP_CHARS:
+                    break
+        return text.strip()
+
+    return await _with_retries(name, attempt)
+
+
+def _template(mode: str) -> str:
+    return PROMPT_TEMPLATE if mode == "meme" else EMOTIONAL_HOROSCOPE_PROMPT
+
+
+async def generate_sign_streaming(mode: str, sign_code: str, date=None, on_text=None):
+    """Stream one sign's horoscope, save it to the cache and return it trimmed.
+
+    Used on a cache miss so the user who asked sees text within seconds
+    instead of waiting for the whole day's run.
+    """
+    date = date or today()
+    name = SIGN_NAMES[sign_code]
+    template = _template(mode)
+    key = make_key(MODEL, template, sign_code, date, TEMPERATURE)
+    started = time.perf_counter()
+    text = await asyncio.to_thread(responses.get, key)
+    if text is None:
+        async with _client() as client:
+            text = await _stream_horoscope(
+                client, name, template.format(sign=name), on_text
+            )
+        await asyncio.to_thread(responses.put, key, text)
+    text = trim_text(text)
+    logger.info(
+        "Streamed %s for mode %s in %.1fs", sign_code, mode, time.perf_counter() - started
+    )
+    await update_day_async(mode, date, {sign_code: text})
+    return text
+
+
+async def generate_all_horoscopes_async(mode: str = "meme", signs=None, date=None):
+    """Generate horoscopes concurrently and save them to cache.
+
+    ``date`` defaults to today in HOROSCOPE_TZ; ``signs`` limits the run to
+    the given sign codes and defaults to the ones the date still lacks, so
+    a rerun resumes where an interrupted one stopped. Every sign is saved
+    as soon as it arrives and raw responses are kept in the response
+    cache, so no text is paid for twice. Failed signs are listed under
+    ``failed`` for the date.
+    """
+    date = date or today()
+    logger.info("Starting horoscope generation for %s", date)
+    template = _template(mode)
+    cache = await asyncio.to_thread(load_cache, mode)
+    if signs is None:
+        signs = missing_signs(cache, date)
+    skipped = len(ZODIAC_SIGNS) - len(signs)
+    failed = set(get_day(cache, date).get("failed", []))
+    horoscopes = {}
+    latency = {}
+    summary = {"requested": 0, "cache_hits": 0, "skipped": skipped}
+    semaphore = asyncio.Semaphore(GENERATION_CONCURRENCY)
+
+    async def generate_sign(client, name: str, code: str):
+        prompt = template.format(sign=name)
+        logger.debug("Prompt for %s: %s", name, prompt)
+        key = make_key(MODEL, template, code, date, TEMPERATURE)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                text = await asyncio.to_thread(responses.get, key)
+                if text is None:
+                    summary["requested"] += 1
+                    text = await _request_horoscope(client, name, prompt)
+                    await asyncio.to_thread(responses.put, key, text)
+                else:
+                    summary["cache_hits"] += 1
+                text = trim_text(text)
+                logger.info("Received %s: %s", name, text[:100])
+                horoscopes[code] = text
+                failed.discard(code)
+                # Checkpoint every sign so a crash loses at most the ones in flight
+                await update_day_async(mode, date, {code: text})
+            except Exception:
+                logger.exception("Error generating %s", code)
+                failed.add(code)
+            latency[code] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    if signs:
+        async with _client() as client:
+            await asyncio.gather(
+                *(
+                    generate_sign(client, name, code)
+                    for name, code in ZODIAC_SIGNS.items()
+                    if code in signs
+                )
+            )
+    wall_time = round(time.perf_counter() - started, 3)
+    await asyncio.to_thread(responses.evict)
+    summary["api_calls_saved"] = summary["cache_hits"] + skipped
+
+    logger.info(
+        "Generated %d signs for mode %s in %.1fs (%d failed, %d API calls made, "
+        "%d saved), per-sign latency: %s",
+        len(latency),
+        mode,
+        wall_time,
+        len(failed),
+        summary["requested"],
+        summary["api_calls_saved"],
+        latency,
+    )
     logger.info("Saving horoscopes to cache for mode %s", mode)
-    save_cache(data, mode)
-    return data
+    return await update_day_async(
+        mode,
+        date,
+        horoscopes,
+        failed=failed,
+        run={"wall_time": wall_time, "latency": latency, **summary},
+    )
 
 
-if __name__ == "__main__":
-    import sys
+def generate_all_horoscopes(mode: str = "meme", signs=None, date=None):
+    """Generate the missing horoscopes (or ``signs``) and save them to cache."""
+    return asyncio.run(generate_all_horoscopes_async(mode, signs, date))
+
+
+async def _stream_job(mode: str, sign: str, date: str, job_id: str, streams: dict):
+    """Stream one sign and publish its partial texts for the bot to relay.
+
+    A job for a sign that is already streaming joins that stream instead:
+    every record it publishes lists the ids of all the jobs it serves.
+    """
+    key = (mode, date, sign)
+    jobs = streams.get(key)
+    if jobs is not None:
+        jobs.append(job_id)
+        return
+    jobs = streams[key] = [job_id]
+    published = 0.0
+
+    async def publish(text):
+        nonlocal published
+        now = time.monotonic()
+        if now - published >= PARTIAL_INTERVAL:
+            published = now
+            await asyncio.to_thread(
+                generation_jobs.publish_partial, mode, date, sign, text, list(jobs)
+            )
 
-    mode = "meme"
-    if len(sys.argv) > 1 and sys.argv[1] in {"meme", "normal"}:
-        mode = sys.argv[1]
-    generate_all_horoscopes(mode)
+    try:
+        text = await generate_sign_streaming(mode, sign, date, publish)
+        state = "done"
+    except Exception:
+        logger.exception("Failed to stream %s for mode %s", sign, mode)
+        text, state = "", "failed"
+    finally:
+        # Jobs arriving from now on start a new stream, served from the
+        # response cache, so none can miss the final record
+        del streams[key]
+    await asyncio.to_thread(
+        generation_jobs.publish_partial, mode, date, sign, text, jobs, state
+    )
+
+
+async def _run_job(job: dict, streams: dict):
+    mode, date = job["mode"], job["date"]
+    try:
+        if job.get("sign"):
+            await _stream_job(mode, job["sign"], date, job.get("id"), streams)
+            return
+        cache = await horoscope_utils.get_cached_async(mode, recheck=True)
+        missing = missing_signs(cache, date)
+        signs = [code for code in job.get("signs") or missing if code in missing]
+        if signs:
+            await horoscope_utils.regenerate(mode, signs, date)
+        await asyncio.to_thread(generation_jobs.publish_finished, mode, date)
+    except Exception:
+        logger.exception("Generation job %s failed", job)
+
+
+async def _publish_metrics():
+    """Share this worker's OpenAI and cache metrics; it serves no /metrics itself."""
+    while True:
+        try:
+            await asyncio.to_thread(generation_jobs.publish_metrics, metrics.dump())
+        except Exception:
+            logger.exception("Failed to publish worker metrics")
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+
+
+async def run_worker():
+    """Serve generation jobs from the state backend queue until cancelled."""
+    # This process is where generation happens
+    horoscope_utils.GENERATION_WORKER = "inline"
+    queue = state_backend.create_backend()
+    slots = asyncio.Semaphore(WORKER_JOBS)
+    streams = {}
+    tasks = set()
+    logger.info("Generation worker %s started", state_backend.INSTANCE_ID)
+    publisher = asyncio.create_task(_publish_metrics())
+    try:
+        while True:
+            await slots.acquire()
+            payload = None
+            while payload is None:
+                payload = await asyncio.to_thread(
+                    queue.pop_job, generation_jobs.QUEUE, 1.0
+                )
+            task = asyncio.create_task(_run_job(json.loads(payload), streams))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda done: slots.release())
+    finally:
+        publisher.cancel()
+        generation_jobs.withdraw_metrics()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate horoscopes into the cache")
+    parser.add_argument("mode", nargs="?", choices=horoscope_utils.MODES, default="meme")
+    parser.add_argument("date", nargs="?", help="YYYY-MM-DD, today by default")
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="serve generation jobs from the bot instead of running once",
+    )
+    args = parser.parse_args()
+    if args.worker:
+        try:
+            asyncio.run(run_worker())
+        except KeyboardInterrupt:
+            pass
+    else:
+        generate_all_horoscopes(args.mode, date=args.date)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Job-request channel between the bot and the generation worker.
+
+The bot never imports the OpenAI client: it pushes generation requests
+to a queue in the state backend and watches the shared horoscope cache.
+The worker (``python generate_horoscopes.py --worker``) pops them,
+writes results to the cache and publishes streamed partial texts and
+run completions as short-lived backend values. Workers also publish
+their metrics snapshots, which the bot adds to its /metrics and /perf.
+"""
+
+import json
+import time
+import uuid
+
+import state_backend
+
+QUEUE = "generation"
+# Seconds partial texts and run completions stay readable
+STATUS_TTL = 600
+# Backend hash of worker metrics snapshots, one field per worker process,
+# and the age (seconds) after which a snapshot belongs to a dead worker
+METRICS_KEY = "worker_metrics"
+METRICS_MAX_AGE = 120
+
+
+def request(mode: str, date: str, signs=None, sign: str = None) -> str:
+    """Ask a worker to generate ``signs`` for the date, or to stream one ``sign``.
+
+    Returns the job id; a streamed sign's partial texts name it.
+    """
+    job_id = uuid.uuid4().hex
+    job = {"id": job_id, "mode": mode, "date": date, "signs": signs, "sign": sign}
+    state_backend.get_backend().push_job(QUEUE, json.dumps(job))
+    return job_id
+
+
+def _partial_key(mode: str, date: str, sign: str) -> str:
+    return f"partial:{mode}:{date}:{sign}"
+
+
+def _finished_key(mode: str, date: str) -> str:
+    return f"finished:{mode}:{date}"
+
+
+def publish_partial(mode, date, sign, text: str, jobs, state="streaming"):
+    """Share the text streamed so far with the requesting ``jobs`` (ids).
+
+    ``state`` ends as "done" or "failed".
+    """
+    value = json.dumps({"text": text, "state": state, "jobs": list(jobs)})
+    state_backend.get_backend().set_value(
+        _partial_key(mode, date, sign), value, STATUS_TTL
+    )
+
+
+def read_partial(mode: str, date: str, sign: str, job_id: str):
+    """Return the latest partial record of the stream serving ``job_id``, if any."""
+    raw = state_backend.get_backend().get_value(_partial_key(mode, date, sign))
+    partial = json.loads(raw) if raw else None
+    if partial is None or job_id not in partial.get("jobs", ()):
+        return None
+    return partial
+
+
+def publish_finished(mode: str, date: str):
+    state_backend.get_backend().set_value(
+        _finished_key(mode, date), str(time.time()), STATUS_TTL
+    )
+
+
+def finished_since(mode: str, date: str, since: float) -> bool:
+    """Return True if a run for the mode and date finished after ``since``."""
+    raw = state_backend.get_backend().get_value(_finished_key(mode, date))
+    return raw is not None and float(raw) >= since
+
+
+def publish_metrics(snapshot: dict):
+    """Store this worker's metrics.dump() for the bot to export."""
+    value = json.dumps({"time": time.time(), "metrics": snapshot})
+    backend = state_backend.get_backend()
+    backend.read_through(METRICS_KEY)
+    backend.hset(METRICS_KEY, state_backend.INSTANCE_ID, value)
+
+
+def withdraw_metrics():
+    state_backend.get_backend().hdel(METRICS_KEY, state_backend.INSTANCE_ID)
+
+
+def read_metrics(max_age: float = METRICS_MAX_AGE) -> dict:
+    """Return {worker: metrics.dump()} of live workers, dropping stale snapshots."""
+    backend = state_backend.get_backend()
+    backend.read_through(METRICS_KEY)
+    now = time.time()
+    snapshots = {}
+    for worker, raw in backend.hgetall(METRICS_KEY).items():
+        entry = json.loads(raw)
+        if now - entry["time"] > max_age:
+            backend.hdel(METRICS_KEY, worker)
+            continue
+        snapshots[worker] = entry["metrics"]
+    return snapshots
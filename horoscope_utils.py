@@ -1,9 +1,23 @@
-import json
 import os
+import time
+import asyncio
 import datetime
+import contextlib
 import logging
+import weakref
+import zoneinfo
 
-CACHE_FILES = {
+import metrics
+import storage
+import state_backend
+import generation_jobs
+from text_utils import trim_text
+
+MODES = ("meme", "normal")
+# Both modes live in one document in the state backend (see state_backend.py)
+CACHE_KEY = "horoscope_cache"
+# Per-mode files used before both modes were stored together
+LEGACY_CACHE_FILES = {
     "meme": os.path.abspath("horoscope_cache_meme.json"),
     "normal": os.path.abspath("horoscope_cache_normal.json"),
 }
@@ -23,40 +37,284 @@ ZODIAC_SIGNS = {
     "Рыбы": "pisces",
 }
 
+# Timezone whose midnight switches readers to the next day; local time if unset
+TIMEZONE_NAME = os.getenv("HOROSCOPE_TZ", "")
+TIMEZONE = zoneinfo.ZoneInfo(TIMEZONE_NAME) if TIMEZONE_NAME else None
+# Days of past horoscopes kept in the cache, and days generated ahead of today
+HISTORY_DAYS = int(os.getenv("HOROSCOPE_HISTORY_DAYS", "2"))
+AHEAD_DAYS = int(os.getenv("HOROSCOPE_AHEAD_DAYS", "1"))
+CACHE_VERSION = 3
+
+# How often (seconds) the in-memory cache re-checks the stored cache version
+CACHE_CHECK_INTERVAL = float(os.getenv("HOROSCOPE_CACHE_CHECK_INTERVAL", "5"))
+# Answer with the latest older text while today's is generated in the background
+STALE_WHILE_REVALIDATE = os.getenv("HOROSCOPE_STALE_WHILE_REVALIDATE", "1") != "0"
+# Minimum pause (seconds) before retrying a regeneration that failed
+REGENERATION_RETRY_INTERVAL = float(os.getenv("HOROSCOPE_REGENERATION_RETRY", "300"))
+# Where OpenAI requests run: "process" (worker processes started by the bot),
+# "external" (a separately run worker service) or "inline" (this process)
+GENERATION_WORKER = os.getenv("GENERATION_WORKER", "process")
+# Seconds to wait for a worker before answering without new texts
+WORKER_WAIT_TIMEOUT = float(os.getenv("GENERATION_WORKER_WAIT", "300"))
+# Seconds between checks for worker results and streamed partial texts
+WORKER_POLL_INTERVAL = float(os.getenv("GENERATION_WORKER_POLL", "0.25"))
+# Lease (seconds) held by the replica generating one mode and date
+GENERATION_LEASE_TTL = float(os.getenv("HOROSCOPE_GENERATION_LEASE", "600"))
+# Lease (seconds) serializing read-modify-write updates of the shared cache,
+# and how long a writer waits for it before giving up
+CACHE_LOCK = "horoscope_cache_write"
+CACHE_LOCK_TTL = 10.0
+CACHE_LOCK_WAIT = 15.0
+
+NOT_FOUND_TEXT = "Сегодня гороскоп не найден, попробуйте позже."
+
 logger = logging.getLogger(__name__)
 
+# {"data": {mode: cache dict}, "version": backend version, "checked": monotonic time}
+_memory_cache = {}
+cache_stats = {"hits": 0, "misses": 0, "reloads": 0}
+metrics.register_dict("horoscope_cache", cache_stats, "In-memory horoscope cache lookups")
+# (mode, date) -> running regeneration task, shared by every caller (single-flight)
+_regenerations = {}
+# (mode, date) -> monotonic time of the last failed regeneration
+_last_failure = {}
+# (mode, date, sign) -> running single-sign streamed generation
+_sign_streams = {}
+# event loop -> lock serializing this process's cache writes on that loop
+_write_locks = weakref.WeakKeyDictionary()
+
+
+class CacheLockTimeout(TimeoutError):
+    """The cache write lease stayed taken for longer than CACHE_LOCK_WAIT."""
+
+
+def today(offset: int = 0) -> str:
+    """Return the ISO date in HOROSCOPE_TZ, shifted by ``offset`` days."""
+    date = datetime.datetime.now(TIMEZONE).date()
+    return (date + datetime.timedelta(days=offset)).isoformat()
+
+
+def empty_cache():
+    return {"days": {}}
+
+
+def _mode(mode: str) -> str:
+    return mode if mode in MODES else "meme"
+
+
+def _upgrade(data):
+    """Convert a single-date per-mode cache to the date-keyed one."""
+    if "days" in data:
+        return {"days": data["days"]}
+    cache = empty_cache()
+    if data.get("date") and data.get("horoscopes"):
+        cache["days"][data["date"]] = {
+            "horoscopes": data["horoscopes"],
+            "failed": data.get("failed", []),
+        }
+    return cache
+
+
+def _load_all():
+    """Load the combined cache, migrating the per-mode files if needed."""
+    data = state_backend.get_backend().load_json(CACHE_KEY, None)
+    if data is None:
+        data = {"version": CACHE_VERSION, "modes": {}}
+        for mode, path in LEGACY_CACHE_FILES.items():
+            if os.path.exists(path):
+                logger.info("Migrating legacy cache %s", path)
+                data["modes"][mode] = _upgrade(storage.read_json(path, {}))
+    modes = data.setdefault("modes", {})
+    for mode in MODES:
+        modes[mode] = _upgrade(modes.get(mode, {}))
+    data["version"] = CACHE_VERSION
+    return data
+
+
+def _save_all(data) -> bool:
+    backend = state_backend.get_backend()
+    try:
+        logger.info("Saving horoscope cache")
+        backend.save_json(CACHE_KEY, data)
+    except Exception:
+        logger.exception("Failed to save horoscope cache")
+        return False
+    _remember(data, backend.json_version(CACHE_KEY))
+    return True
+
 
 def load_cache(mode: str = "meme"):
-    """Load horoscope cache for the given mode from file."""
-    path = CACHE_FILES.get(mode, CACHE_FILES["meme"])
-    if os.path.exists(path):
-        try:
-            logger.info("Loading cache from %s", path)
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            logger.exception("Failed to load cache %s", path)
-    else:
-        logger.debug("Cache file %s does not exist", path)
-    return {"date": "", "horoscopes": {}}
+    """Load horoscope cache for the given mode from the backend."""
+    return _load_all()["modes"][_mode(mode)]
 
 
 def save_cache(data, mode: str = "meme"):
-    """Save horoscope cache for the given mode to file."""
-    path = CACHE_FILES.get(mode, CACHE_FILES["meme"])
+    """Save horoscope cache for the given mode to the backend."""
+    with _cache_lock():
+        combined = _load_all()
+        combined["modes"][_mode(mode)] = data
+        _save_all(combined)
+
+
+def _merge_day(mode: str, date: str, horoscopes=None, failed=None, run=None):
+    """Load, merge one date into the mode's cache, prune old days and save."""
+    combined = _load_all()
+    cache = combined["modes"][_mode(mode)]
+    days = cache["days"]
+    day = days.setdefault(date, {"horoscopes": {}, "failed": []})
+    if horoscopes:
+        day["horoscopes"].update(horoscopes)
+    if failed is not None:
+        day["failed"] = sorted(failed)
+    if run is not None:
+        day["run"] = run
+    oldest = today(-HISTORY_DAYS)
+    for old in [d for d in days if d < oldest]:
+        del days[old]
+    _save_all(combined)
+    return cache
+
+
+def update_day(mode: str, date: str, horoscopes=None, failed=None, run=None):
+    """Merge generated texts for one date into the mode's cache and prune old days.
+
+    Blocking variant for scripts; coroutines use ``update_day_async``.
+    """
+    with _cache_lock():
+        return _merge_day(mode, date, horoscopes, failed, run)
+
+
+async def update_day_async(mode: str, date: str, horoscopes=None, failed=None, run=None):
+    """Merge texts like ``update_day`` without blocking the event loop.
+
+    The load, merge and save run in a thread while this process holds an
+    asyncio lock and the backend lease, so concurrent generations in this
+    or another process can't overwrite each other. Raises
+    CacheLockTimeout instead of writing without the lease.
+    """
+    async with _async_cache_lock():
+        return await asyncio.to_thread(_merge_day, mode, date, horoscopes, failed, run)
+
+
+@contextlib.contextmanager
+def _cache_lock():
+    """Hold the backend lease that serializes cache read-modify-write cycles."""
+    backend = state_backend.get_backend()
+    owner = state_backend.INSTANCE_ID
+    deadline = time.monotonic() + CACHE_LOCK_WAIT
+    while not backend.acquire_lease(CACHE_LOCK, owner, CACHE_LOCK_TTL):
+        if time.monotonic() > deadline:
+            raise CacheLockTimeout("Timed out waiting for the horoscope cache lock")
+        time.sleep(0.01)
     try:
-        logger.info("Saving cache to %s", path)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception:
-        logger.exception("Failed to save cache %s", path)
+        yield
+    finally:
+        backend.release_lease(CACHE_LOCK, owner)
+
+
+@contextlib.asynccontextmanager
+async def _async_cache_lock():
+    """Async ``_cache_lock``: waits with asyncio.sleep, backend calls in threads.
+
+    The lease is owned per process, so writers in this process are also
+    serialized by a lock of their own.
+    """
+    loop = asyncio.get_running_loop()
+    local = _write_locks.get(loop)
+    if local is None:
+        local = _write_locks[loop] = asyncio.Lock()
+    backend = state_backend.get_backend()
+    owner = state_backend.INSTANCE_ID
+    async with local:
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while not await asyncio.to_thread(
+            backend.acquire_lease, CACHE_LOCK, owner, CACHE_LOCK_TTL
+        ):
+            if time.monotonic() > deadline:
+                raise CacheLockTimeout("Timed out waiting for the horoscope cache lock")
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(backend.release_lease, CACHE_LOCK, owner)
+
+
+def _remember(data, version):
+    """Keep every mode in memory with its texts already trimmed for sending."""
+    modes = {}
+    for mode, cache in data["modes"].items():
+        days = {}
+        for date, day in cache.get("days", {}).items():
+            horoscopes = day.get("horoscopes", {})
+            trimmed = {code: trim_text(text) for code, text in horoscopes.items()}
+            days[date] = dict(day, horoscopes=trimmed)
+        modes[mode] = dict(cache, days=days)
+    _memory_cache.update(data=modes, version=version, checked=time.monotonic())
+    return modes
+
+
+def get_cached(mode: str = "meme", recheck: bool = False):
+    """Return cache data for the given mode, reloading it only when it changed.
+
+    ``recheck`` looks at the stored version even if it was checked recently.
+    """
+    mode = _mode(mode)
+    now = time.monotonic()
+    if (
+        _memory_cache
+        and not recheck
+        and now - _memory_cache["checked"] < CACHE_CHECK_INTERVAL
+    ):
+        cache_stats["hits"] += 1
+        return _memory_cache["data"][mode]
+    version = state_backend.get_backend().json_version(CACHE_KEY)
+    if _memory_cache and _memory_cache["version"] == version:
+        _memory_cache["checked"] = now
+        cache_stats["hits"] += 1
+        return _memory_cache["data"][mode]
+    if not _memory_cache:
+        cache_stats["misses"] += 1
+    else:
+        cache_stats["reloads"] += 1
+    return _remember(_load_all(), version)[mode]
+
+
+async def get_cached_async(mode: str = "meme", recheck: bool = False):
+    """``get_cached`` that checks the stored version in a thread, off the loop."""
+    if (
+        _memory_cache
+        and not recheck
+        and time.monotonic() - _memory_cache["checked"] < CACHE_CHECK_INTERVAL
+    ):
+        cache_stats["hits"] += 1
+        return _memory_cache["data"][_mode(mode)]
+    return await asyncio.to_thread(get_cached, mode, recheck)
+
+
+def get_day(cache, date: str = None):
+    """Return the cache entry for the date (today by default), or an empty dict."""
+    return cache.get("days", {}).get(date or today(), {})
+
+
+def is_fresh(cache, date: str = None) -> bool:
+    """Return True if the cache holds horoscopes for the date (today by default)."""
+    return bool(get_day(cache, date).get("horoscopes"))
+
+
+def missing_signs(cache, date: str = None):
+    """Return the sign codes that have no text for the date yet."""
+    horoscopes = get_day(cache, date).get("horoscopes", {})
+    return [code for code in ZODIAC_SIGNS.values() if code not in horoscopes]
 
 
 def refresh_cache_if_needed(mode: str = "meme"):
     """Return cached data, regenerating if it's missing or outdated."""
-    cache = load_cache(mode)
-    today = datetime.date.today().isoformat()
-    if cache.get("date") == today and cache.get("horoscopes"):
+    cache = get_cached(mode)
+    if is_fresh(cache):
+        return cache
+    if GENERATION_WORKER != "inline":
+        logger.info("Cache outdated, asking a worker to generate mode %s", mode)
+        generation_jobs.request(mode, today(), missing_signs(cache))
         return cache
     try:
         import generate_horoscopes
@@ -68,22 +326,219 @@ def refresh_cache_if_needed(mode: str = "meme"):
     return cache
 
 
+async def _generate_inline(mode: str, signs, date: str):
+    backend = state_backend.get_backend()
+    lease = f"generate:{mode}:{date}"
+    if not await asyncio.to_thread(
+        backend.acquire_lease, lease, state_backend.INSTANCE_ID, GENERATION_LEASE_TTL
+    ):
+        # Another process is generating; its texts arrive via the cache version
+        logger.info("Horoscopes for %s, %s are generated elsewhere", mode, date)
+        return await get_cached_async(mode)
+    logger.info("Generating horoscopes for mode %s, date %s", mode, date)
+    try:
+        import generate_horoscopes
+
+        return await generate_horoscopes.generate_all_horoscopes_async(
+            mode, signs, date
+        )
+    except Exception:
+        logger.exception("Failed to regenerate horoscope cache")
+        return await get_cached_async(mode)
+    finally:
+        await asyncio.to_thread(backend.release_lease, lease, state_backend.INSTANCE_ID)
+
+
+async def _generate_in_worker(mode: str, signs, date: str):
+    """Queue a generation job and wait until its texts reach the shared cache."""
+    signs = signs or list(ZODIAC_SIGNS.values())
+    since = time.time()
+    logger.info("Requesting horoscopes for mode %s, date %s from a worker", mode, date)
+    await asyncio.to_thread(generation_jobs.request, mode, date, signs)
+    deadline = time.monotonic() + WORKER_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(WORKER_POLL_INTERVAL)
+        cache = await get_cached_async(mode, recheck=True)
+        missing = missing_signs(cache, date)
+        if not any(code in missing for code in signs):
+            return cache
+        if await asyncio.to_thread(generation_jobs.finished_since, mode, date, since):
+            return await get_cached_async(mode, recheck=True)
+    logger.error("No generation worker answered for mode %s, date %s", mode, date)
+    return await get_cached_async(mode)
+
+
+async def _run_regeneration(mode: str, signs, date: str):
+    if GENERATION_WORKER == "inline":
+        cache = await _generate_inline(mode, signs, date)
+    else:
+        cache = await _generate_in_worker(mode, signs, date)
+    if missing_signs(cache, date):
+        _last_failure[(mode, date)] = time.monotonic()
+    else:
+        _last_failure.pop((mode, date), None)
+    return cache
+
+
+def regenerate(mode: str = "meme", signs=None, date: str = None) -> "asyncio.Future":
+    """Start generating the mode's horoscopes for a date, or join the running job.
+
+    Generation is asynchronous, so the event loop keeps serving users.
+    """
+    key = (mode, date or today())
+    task = _regenerations.get(key)
+    if task is None or task.done():
+        task = asyncio.ensure_future(_run_regeneration(mode, signs, key[1]))
+        _regenerations[key] = task
+
+        def _forget(done):
+            if _regenerations.get(key) is done:
+                del _regenerations[key]
+
+        task.add_done_callback(_forget)
+    return task
+
+
+def _retry_allowed(key) -> bool:
+    failed_at = _last_failure.get(key)
+    if key in _regenerations or failed_at is None:
+        return True
+    return time.monotonic() - failed_at >= REGENERATION_RETRY_INTERVAL
+
+
+async def refresh_cache_async(mode: str = "meme"):
+    """Async variant of refresh_cache_if_needed that never blocks the event loop.
+
+    Concurrent callers share one generation per mode and date. If today's
+    texts exist, or STALE_WHILE_REVALIDATE allows serving older ones, the
+    cache is returned at once and missing signs are filled in the background.
+    """
+    cache = await get_cached_async(mode)
+    date = today()
+    missing = missing_signs(cache, date)
+    if not missing or not _retry_allowed((mode, date)):
+        return cache
+    task = regenerate(mode, missing, date)
+    if is_fresh(cache, date) or (STALE_WHILE_REVALIDATE and cache.get("days")):
+        return cache
+    return await asyncio.shield(task)
+
+
+async def pregenerate(mode: str = "meme") -> bool:
+    """Generate every missing sign from today up to AHEAD_DAYS ahead.
+
+    Returns True when all of those days are complete.
+    """
+    complete = True
+    for offset in range(AHEAD_DAYS + 1):
+        date = today(offset)
+        missing = missing_signs(await get_cached_async(mode), date)
+        if missing:
+            cache = await regenerate(mode, missing, date)
+            complete = complete and not missing_signs(cache, date)
+    return complete
+
+
+def _find(cache, sign_code, allow_stale: bool = False):
+    """Return today's text for the sign, or the latest older one if allowed."""
+    date = today()
+    horoscope = get_day(cache, date).get("horoscopes", {}).get(sign_code)
+    if horoscope:
+        logger.debug("Delivering horoscope for %s from cache", sign_code)
+        return horoscope
+    if allow_stale:
+        days = cache.get("days", {})
+        for older in sorted((d for d in days if d < date), reverse=True):
+            horoscope = days[older].get("horoscopes", {}).get(sign_code)
+            if horoscope:
+                logger.debug("Delivering %s horoscope for %s", older, sign_code)
+                return horoscope
+    return None
+
+
+def _lookup(cache, sign_code, allow_stale: bool = False):
+    horoscope = _find(cache, sign_code, allow_stale)
+    if horoscope:
+        return horoscope
+    logger.error("Horoscope for %s not found in cache for %s", sign_code, today())
+    return NOT_FOUND_TEXT
+
+
 def get_horoscope(sign_code, mode: str = "meme"):
     """Return horoscope text for the given sign from cache, refreshing if needed."""
-    today = datetime.date.today().isoformat()
-    cache = refresh_cache_if_needed(mode)
-    logger.debug("Cache date: %s, today: %s", cache.get("date"), today)
-    if cache.get("date") != today:
-        logger.error(
-            "Horoscope cache for %s is outdated: cache date %s, today %s",
-            sign_code,
-            cache.get("date"),
-            today,
+    return _lookup(refresh_cache_if_needed(mode), sign_code)
+
+
+async def get_horoscope_async(sign_code, mode: str = "meme"):
+    """Return horoscope text for the sign without blocking the event loop."""
+    cache = await refresh_cache_async(mode)
+    return _lookup(cache, sign_code, allow_stale=STALE_WHILE_REVALIDATE)
+
+
+async def _stream_from_worker(mode: str, sign_code: str, date: str, on_text):
+    """Queue a streaming job and relay the partial texts the worker publishes."""
+    job_id = await asyncio.to_thread(
+        generation_jobs.request, mode, date, sign=sign_code
+    )
+    shown = None
+    deadline = time.monotonic() + WORKER_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(WORKER_POLL_INTERVAL)
+        partial = await asyncio.to_thread(
+            generation_jobs.read_partial, mode, date, sign_code, job_id
+        )
+        if partial is None:
+            continue
+        if partial["state"] == "done":
+            return partial["text"]
+        if partial["state"] == "failed":
+            raise RuntimeError(f"Worker failed to stream {sign_code}")
+        if on_text is not None and partial["text"] != shown:
+            shown = partial["text"]
+            await on_text(shown)
+    raise TimeoutError(f"No generation worker streamed {sign_code}")
+
+
+async def _stream_sign(mode: str, sign_code: str, date: str, on_text):
+    logger.info("Streaming %s horoscope for mode %s, date %s", sign_code, mode, date)
+    try:
+        if GENERATION_WORKER != "inline":
+            return await _stream_from_worker(mode, sign_code, date, on_text)
+        import generate_horoscopes
+
+        return await generate_horoscopes.generate_sign_streaming(
+            mode, sign_code, date, on_text
         )
-        return "Сегодня гороскоп не найден, попробуйте позже."
-    horoscope = cache.get("horoscopes", {}).get(sign_code)
-    if not horoscope:
-        logger.error("Horoscope for %s not found in cache", sign_code)
-        return "Сегодня гороскоп не найден, попробуйте позже."
-    logger.info("Delivering horoscope for %s from cache", sign_code)
-    return horoscope
+    except Exception:
+        logger.exception("Failed to stream horoscope for %s", sign_code)
+        _last_failure[(mode, date)] = time.monotonic()
+        return None
+
+
+async def get_horoscope_streaming(sign_code, mode: str = "meme", on_text=None):
+    """Return horoscope text for the sign, generating just that sign on a miss.
+
+    When there is nothing to show (no text for today and no older one
+    allowed by STALE_WHILE_REVALIDATE), only this sign is requested with
+    the streaming API and ``on_text`` is awaited with the text so far as
+    it arrives; the day's other missing signs are generated in the
+    background. Concurrent callers for the same sign share one stream.
+    """
+    mode = _mode(mode)
+    cache = await get_cached_async(mode)
+    date = today()
+    if _find(cache, sign_code, STALE_WHILE_REVALIDATE) or not _retry_allowed(
+        (mode, date)
+    ):
+        return await get_horoscope_async(sign_code, mode)
+    key = (mode, date, sign_code)
+    task = _sign_streams.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_stream_sign(mode, sign_code, date, on_text))
+        _sign_streams[key] = task
+        task.add_done_callback(lambda done: _sign_streams.pop(key, None))
+        others = [code for code in missing_signs(cache, date) if code != sign_code]
+        if others:
+            regenerate(mode, others, date)
+    horoscope = await asyncio.shield(task)
+    return horoscope or _lookup(await get_cached_async(mode), sign_code)
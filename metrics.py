@@ -0,0 +1,326 @@
+"""In-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are plain dicts keyed by label values,
+cheap enough to stay enabled in production. ``render`` produces the
+Prometheus text format served by ``start_http_server``.
+
+Processes without an endpoint (the generation workers) publish ``dump``
+snapshots; the bot registers a ``set_remote_source`` that fetches them,
+and their values are added to its own in ``render`` and ``summary``.
+"""
+
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+
+_registry = []
+# Callables yielding extra (name, type, help, value) samples
+_collectors = []
+# Callable returning {process id: dump()} of other processes, and the last result
+_remote_source = None
+_remote = {}
+
+
+def _add(total, value):
+    """Add a remote counter value or histogram row to a local one."""
+    if total is None:
+        return list(value) if isinstance(value, list) else value
+    if isinstance(total, list):
+        return [a + b for a, b in zip(total, value)]
+    return total + value
+
+
+def _merged(name: str, values: dict) -> dict:
+    """Return ``values`` with the same metric's values from other processes added."""
+    if not _remote:
+        return values
+    merged = dict(values)
+    for dump in _remote.values():
+        for key, value in dump.get("metrics", {}).get(name, ()):
+            key = tuple(key)
+            merged[key] = _add(merged.get(key), value)
+    return merged
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, *label_values):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return _merged(self.name, self.values).get(label_values, 0)
+
+    def samples(self):
+        for key, value in list(_merged(self.name, self.values).items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+    def dec(self, amount: float = 1, *label_values):
+        self.inc(-amount, *label_values)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values):
+        row = self.values.get(label_values)
+        if row is None:
+            row = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def count(self, *label_values) -> int:
+        row = _merged(self.name, self.values).get(label_values)
+        return sum(row[:-1]) if row else 0
+
+    def quantile(self, q: float, *label_values) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        row = _merged(self.name, self.values).get(label_values)
+        if not row:
+            return 0.0
+        rank = q * sum(row[:-1])
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        for key, row in list(_merged(self.name, self.values).items()):
+            row = list(row)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), key + (bound,))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum", labels, row[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+def register_collector(collector):
+    """Register a callable yielding (name, type, help, value) tuples."""
+    _collectors.append(collector)
+
+
+def register_dict(prefix: str, counters: dict, help: str = ""):
+    """Expose an existing dict of counters as ``<prefix>_<key>_total``."""
+
+    def collect():
+        for key, value in list(counters.items()):
+            yield f"{prefix}_{key}_total", "counter", help, value
+
+    register_collector(collect)
+
+
+def dump() -> dict:
+    """Return this process's metric values in a JSON-serializable form."""
+    return {
+        "metrics": {
+            metric.name: [[list(key), value] for key, value in list(metric.values.items())]
+            for metric in _registry
+            if metric.values
+        },
+        "collected": [list(sample) for collector in _collectors for sample in collector()],
+    }
+
+
+def set_remote_source(source):
+    """Register a callable returning {process id: dump()} for other processes."""
+    global _remote_source
+    _remote_source = source
+
+
+def _pull_remote():
+    global _remote
+    if _remote_source is None:
+        return
+    try:
+        _remote = _remote_source()
+    except Exception:
+        logger.exception("Failed to read metrics of other processes")
+
+
+def _collected():
+    """Yield collector samples, summing same-named ones from other processes."""
+    samples = {}
+    dumps = [dump.get("collected", ()) for dump in _remote.values()]
+    for collected in [(s for c in _collectors for s in c())] + dumps:
+        for name, kind, help, value in collected:
+            if name in samples:
+                samples[name][2] += value
+            else:
+                samples[name] = [kind, help, value]
+    for name, (kind, help, value) in samples.items():
+        yield name, kind, help, value
+
+
+def render() -> str:
+    """Return every metric in Prometheus text exposition format."""
+    _pull_remote()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    for name, kind, help, value in _collected():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Handler latency in seconds", ["handler"]
+)
+HANDLER_IN_FLIGHT = Gauge(
+    "bot_handler_in_flight", "Handler calls currently running", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Handler calls that raised", ["handler"]
+)
+JOB_SECONDS = Histogram("bot_job_seconds", "Scheduled job duration in seconds", ["job"])
+JOB_ERRORS = Counter("bot_job_errors_total", "Scheduled job runs that raised", ["job"])
+
+OPENAI_SECONDS = Histogram(
+    "openai_request_seconds", "OpenAI chat-completion latency in seconds"
+)
+OPENAI_FIRST_TOKEN_SECONDS = Histogram(
+    "openai_first_token_seconds", "Time to the first streamed token in seconds"
+)
+OPENAI_RETRIES = Counter("openai_retries_total", "OpenAI requests retried")
+OPENAI_ERRORS = Counter("openai_errors_total", "OpenAI requests that failed for good")
+OPENAI_TOKENS = Counter("openai_tokens_total", "OpenAI tokens used", ["kind"])
+
+
+def instrument(callback, name: str = None):
+    """Wrap a handler coroutine to record latency, in-flight calls and errors."""
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        HANDLER_IN_FLIGHT.inc(1, name)
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(1, name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            HANDLER_IN_FLIGHT.dec(1, name)
+
+    return wrapper
+
+
+def instrument_job(callback, name: str = None):
+    """Wrap a job_queue callback to record its duration and errors."""
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            JOB_ERRORS.inc(1, name)
+            raise
+        finally:
+            JOB_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+def summary() -> list:
+    """Return human-readable lines for the admin /perf command."""
+    _pull_remote()
+    lines = []
+    for (name,) in sorted(HANDLER_SECONDS.values):
+        count = HANDLER_SECONDS.count(name)
+        lines.append(
+            f"{name}: {count} вызовов, p50≤{HANDLER_SECONDS.quantile(0.5, name)}с, "
+            f"p99≤{HANDLER_SECONDS.quantile(0.99, name)}с, "
+            f"ошибок {int(HANDLER_ERRORS.get(name))}"
+        )
+    for (name,) in sorted(JOB_SECONDS.values):
+        lines.append(
+            f"job {name}: {JOB_SECONDS.count(name)} запусков, "
+            f"ошибок {int(JOB_ERRORS.get(name))}"
+        )
+    if OPENAI_SECONDS.count():
+        lines.append(
+            f"OpenAI: {OPENAI_SECONDS.count()} запросов, "
+            f"p50≤{OPENAI_SECONDS.quantile(0.5)}с, повторов {int(OPENAI_RETRIES.get())}, "
+            f"токенов {int(OPENAI_TOKENS.get('prompt') + OPENAI_TOKENS.get('completion'))}"
+        )
+    for name, _, _, value in _collected():
+        lines.append(f"{name}: {value}")
+    return lines
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1"):
+    """Serve /metrics from a daemon thread and return the server."""
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(
+        "Metrics endpoint listening on http://%s:%s/metrics", *server.server_address
+    )
+    return server
@@ -0,0 +1,58 @@
+"""Reminder subscriptions kept in the state backend."""
+
+import os
+import logging
+
+from bot_utils import load_json
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderStore:
+    """Subscribed chat ids with cheap membership checks and one-row writes.
+
+    Subscribe/unsubscribe touch a single member of the backend set, so
+    toggles never rewrite the whole list.
+    """
+
+    def __init__(self, backend, legacy_json=None, key: str = "reminders"):
+        self.backend = backend
+        self.key = key
+        if legacy_json:
+            self._migrate(legacy_json)
+
+    def _migrate(self, path):
+        """Import chats from the old reminders.json list once, then retire the file."""
+        if not os.path.exists(path):
+            return
+        chats = load_json(path, {"chats": []}).get("chats", [])
+        self.backend.add_members(self.key, chats)
+        os.replace(path, path + ".migrated")
+        logger.info("Migrated %d reminder chats from %s", len(chats), path)
+
+    def __contains__(self, chat_id) -> bool:
+        return self.backend.has_member(self.key, chat_id)
+
+    def __len__(self) -> int:
+        return self.backend.count_members(self.key)
+
+    def subscribe(self, chat_id) -> bool:
+        """Add the chat; return False if it was already subscribed."""
+        return self.backend.add_member(self.key, chat_id)
+
+    def unsubscribe(self, chat_id) -> bool:
+        """Remove the chat; return False if it wasn't subscribed."""
+        return self.backend.remove_member(self.key, chat_id)
+
+    def iter_chats(self, after=None, batch_size: int = 500):
+        """Yield subscribed chat ids in ascending order, one batch query at a time.
+
+        ``after`` skips every chat id up to and including it.
+        """
+        last = after
+        while True:
+            chats = self.backend.scan_members(self.key, last, batch_size)
+            if not chats:
+                return
+            yield from chats
+            last = chats[-1]
@@ -0,0 +1,80 @@
+"""Content-addressed cache of raw OpenAI responses.
+
+Entries are keyed by a hash of everything that determines the request
+(model, prompt template, sign, date and temperature), so a rerun never
+pays for a text it already received. Entries live in the state backend
+and are evicted by age and by count.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Responses older than this many seconds are dropped
+RESPONSE_CACHE_MAX_AGE = float(os.getenv("RESPONSE_CACHE_MAX_AGE", str(7 * 86400)))
+# At most this many responses are kept; the oldest go first
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+
+
+def make_key(model: str, template: str, sign: str, date: str, temperature: float) -> str:
+    """Return the cache key for one request."""
+    material = json.dumps([model, template, sign, date, temperature], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Raw response texts stored in a backend hash, one field per key."""
+
+    def __init__(
+        self,
+        backend,
+        name: str = "openai_responses",
+        max_age: float = RESPONSE_CACHE_MAX_AGE,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        self.backend = backend
+        self.name = name
+        # Every generation worker adds responses; read what the others stored
+        backend.read_through(name)
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str):
+        """Return the cached text for ``key``, or None if missing or expired."""
+        raw = self.backend.hget(self.name, key)
+        entry = json.loads(raw) if raw else None
+        if entry is None or time.time() - entry["created"] > self.max_age:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry["text"]
+
+    def put(self, key: str, text: str):
+        entry = {"text": text, "created": time.time()}
+        self.backend.hset(self.name, key, json.dumps(entry, ensure_ascii=False))
+
+    def evict(self) -> int:
+        """Drop expired entries and the oldest ones over the size limit."""
+        now = time.time()
+        entries = []
+        for key, raw in self.backend.hgetall(self.name).items():
+            try:
+                created = json.loads(raw)["created"]
+            except (ValueError, KeyError, TypeError):
+                created = 0
+            entries.append((created, key))
+        entries.sort(reverse=True)
+        doomed = [key for created, key in entries if now - created > self.max_age]
+        fresh = [key for created, key in entries if now - created <= self.max_age]
+        doomed += fresh[self.max_entries:]
+        for key in doomed:
+            self.backend.hdel(self.name, key)
+        if doomed:
+            logger.info("Evicted %d cached OpenAI responses", len(doomed))
+        self.stats["evictions"] += len(doomed)
+        return len(doomed)
@@ -0,0 +1,639 @@
+"""Shared-state backends for stats, reminders, caches and job coordination.
+
+``FileBackend`` keeps everything in local files and SQLite, which is the
+single-process behaviour. ``RedisBackend`` talks the Redis protocol so
+several bot replicas can share counters, subscribers, the horoscope
+cache and a leader lease for scheduled jobs. Pick one with
+STATE_BACKEND=file|redis (and REDIS_URL); ``get_backend`` returns the
+process-wide instance.
+"""
+
+import os
+import socket
+import functools
+import threading
+import time
+import logging
+from urllib.parse import urlparse
+
+import storage
+from bot_utils import open_db
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "file")
+DB_FILE = os.path.abspath(os.getenv("BOT_DB", "bot.db"))
+STATE_DIR = os.path.abspath(os.getenv("STATE_DIR", "."))
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "crisis:")
+# Identifies this process as the owner of leases
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+_backend = None
+
+
+def _locked(method):
+    """Run a FileBackend method under the backend's lock."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class FileBackend:
+    """Local backend: JSON files via storage.py plus one SQLite database."""
+
+    shared = False
+
+    def __init__(self, db_path=DB_FILE, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.conn = open_db(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS members ("
+                "key TEXT NOT NULL, member INTEGER NOT NULL, "
+                "PRIMARY KEY (key, member))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "key TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (key, field))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+                "payload TEXT NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS ephemeral ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+        self._migrate_reminders_table()
+        # key -> set / dict, loaded on first use and kept in sync on writes
+        self._members = {}
+        self._hashes = {}
+        # hashes other processes write to, never cached (see read_through)
+        self._uncached = set()
+        # Calls may come from threads (asyncio.to_thread) as well as the loop
+        self.lock = threading.RLock()
+
+    def _migrate_reminders_table(self):
+        """Move rows from the reminders table used before backends existed."""
+        row = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reminders'"
+        ).fetchone()
+        if row is None:
+            return
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO members (key, member) "
+                "SELECT 'reminders', chat_id FROM reminders"
+            )
+            self.conn.execute("DROP TABLE reminders")
+        logger.info("Migrated reminders table to the members table")
+
+    # JSON documents
+
+    def json_path(self, key: str) -> str:
+        return os.path.join(self.state_dir, key + ".json")
+
+    def load_json(self, key: str, default):
+        return storage.read_json(self.json_path(key), default)
+
+    def save_json(self, key: str, data):
+        storage.write_json(self.json_path(key), data)
+
+    def json_version(self, key: str):
+        """Return a value that changes whenever the document is rewritten.
+
+        Every save renames a new file into place, so the inode changes even
+        when two writes land within the filesystem's timestamp granularity.
+        """
+        try:
+            stat = os.stat(self.json_path(key))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    # Counters
+
+    @_locked
+    def incr_counters(self, deltas: dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                deltas.items(),
+            )
+
+    @_locked
+    def get_counters(self) -> dict:
+        return dict(self.conn.execute("SELECT name, value FROM counters"))
+
+    # Integer member sets, ordered by value
+
+    def _member_set(self, key: str) -> set:
+        members = self._members.get(key)
+        if members is None:
+            rows = self.conn.execute("SELECT member FROM members WHERE key = ?", (key,))
+            members = self._members[key] = {member for (member,) in rows}
+        return members
+
+    @_locked
+    def add_member(self, key: str, member: int) -> bool:
+        members = self._member_set(key)
+        if member in members:
+            return False
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO members (key, member) VALUES (?, ?)",
+                (key, member),
+            )
+        members.add(member)
+        return True
+
+    @_locked
+    def add_members(self, key: str, members):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO members (key, member) VALUES (?, ?)",
+                ((key, member) for member in members),
+            )
+        self._members.pop(key, None)
+
+    @_locked
+    def remove_member(self, key: str, member: int) -> bool:
+        members = self._member_set(key)
+        if member not in members:
+            return False
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM members WHERE key = ? AND member = ?", (key, member)
+            )
+        members.discard(member)
+        return True
+
+    @_locked
+    def has_member(self, key: str, member: int) -> bool:
+        return member in self._member_set(key)
+
+    @_locked
+    def count_members(self, key: str) -> int:
+        return len(self._member_set(key))
+
+    @_locked
+    def scan_members(self, key: str, after=None, limit: int = 500) -> list:
+        """Return up to ``limit`` members greater than ``after``, ascending."""
+        if after is None:
+            rows = self.conn.execute(
+                "SELECT member FROM members WHERE key = ? ORDER BY member LIMIT ?",
+                (key, limit),
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT member FROM members WHERE key = ? AND member > ? "
+                "ORDER BY member LIMIT ?",
+                (key, after, limit),
+            )
+        return [member for (member,) in rows]
+
+    # String hashes
+
+    def read_through(self, key: str):
+        """Always read the hash from the database instead of a cached copy.
+
+        For hashes that other processes sharing the database write to,
+        such as the generation workers' response cache.
+        """
+        self._uncached.add(key)
+        self._hashes.pop(key, None)
+
+    def _hash(self, key: str) -> dict:
+        values = self._hashes.get(key)
+        if values is None:
+            rows = self.conn.execute(
+                "SELECT field, value FROM hashes WHERE key = ?", (key,)
+            )
+            values = dict(rows)
+            if key not in self._uncached:
+                self._hashes[key] = values
+        return values
+
+    @_locked
+    def hget(self, key: str, field: str):
+        if key in self._uncached:
+            row = self.conn.execute(
+                "SELECT value FROM hashes WHERE key = ? AND field = ?", (key, field)
+            ).fetchone()
+            return row[0] if row else None
+        return self._hash(key).get(field)
+
+    @_locked
+    def hgetall(self, key: str) -> dict:
+        return dict(self._hash(key))
+
+    @_locked
+    def hset(self, key: str, field: str, value: str):
+        values = self._hash(key)
+        if values.get(field) == value:
+            return
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO hashes (key, field, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(key, field) DO UPDATE SET value = excluded.value",
+                (key, field, value),
+            )
+        values[field] = value
+
+    @_locked
+    def hdel(self, key: str, field: str):
+        values = self._hash(key)
+        if values.pop(field, None) is None:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM hashes WHERE key = ? AND field = ?", (key, field)
+            )
+
+    @_locked
+    def hincr(self, key: str, deltas: dict):
+        """Add integer ``deltas`` to the hash's fields."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO hashes (key, field, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(key, field) DO UPDATE SET "
+                "value = CAST(CAST(value AS INTEGER) + excluded.value AS TEXT)",
+                ((key, field, amount) for field, amount in deltas.items()),
+            )
+        values = self._hashes.get(key)
+        if values is not None:
+            for field, amount in deltas.items():
+                values[field] = str(int(values.get(field, 0)) + amount)
+
+    @_locked
+    def delete_hash(self, key: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM hashes WHERE key = ?", (key,))
+        self._hashes.pop(key, None)
+
+    # Short-lived values and job queues, always read from the database so
+    # other processes see them at once
+
+    @_locked
+    def set_value(self, key: str, value: str, ttl: float):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO ephemeral (key, value, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "value = excluded.value, expires = excluded.expires",
+                (key, value, time.time() + ttl),
+            )
+
+    @_locked
+    def get_value(self, key: str):
+        row = self.conn.execute(
+            "SELECT value FROM ephemeral WHERE key = ? AND expires > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    @_locked
+    def push_job(self, queue: str, payload: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO queue (name, payload) VALUES (?, ?)", (queue, payload)
+            )
+
+    def pop_job(self, queue: str, timeout: float = 1.0):
+        """Remove and return the oldest job, waiting up to ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT id, payload FROM queue WHERE name = ? ORDER BY id LIMIT 1",
+                    (queue,),
+                ).fetchone()
+                if row is not None:
+                    with self.conn:
+                        taken = self.conn.execute(
+                            "DELETE FROM queue WHERE id = ?", (row[0],)
+                        ).rowcount
+                    if taken:
+                        return row[1]
+                    continue
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.1)
+
+    # Leases
+
+    @_locked
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease; return True if ``owner`` holds it now."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET "
+                "owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (name, owner, now + ttl, now),
+            )
+        row = self.conn.execute(
+            "SELECT owner FROM leases WHERE name = ?", (name,)
+        ).fetchone()
+        return row is not None and row[0] == owner
+
+    @_locked
+    def release_lease(self, name: str, owner: str):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner)
+            )
+
+    @_locked
+    def close(self):
+        self.conn.close()
+
+
+class RedisError(Exception):
+    """Error reply from the Redis server."""
+
+
+class RedisClient:
+    """Minimal blocking RESP2 client with pipelining."""
+
+    def __init__(self, url: str = REDIS_URL, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if self.password:
+            self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            self._roundtrip([("SELECT", self.db)])
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply {line!r}")
+
+    def _roundtrip(self, commands):
+        self.sock.sendall(b"".join(self._encode(args) for args in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def pipeline(self, commands):
+        """Send all commands at once and return their replies in order."""
+        with self.lock:
+            for attempt in (0, 1):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    return self._roundtrip(commands)
+                except (OSError, ConnectionError):
+                    self.close()
+                    if attempt:
+                        raise
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+
+
+# Lease renewal and release run server-side, so a lease that expired and
+# was taken by another owner between the check and the write is never touched
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend:
+    """Backend shared by several replicas through a Redis-protocol server."""
+
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX):
+        self.client = RedisClient(url)
+        self.prefix = prefix
+
+    def _key(self, *parts) -> str:
+        return self.prefix + ":".join(parts)
+
+    # JSON documents
+
+    def load_json(self, key: str, default):
+        raw = self.client.execute("GET", self._key("json", key))
+        if raw is None:
+            return default
+        try:
+            return storage.decode(raw)
+        except storage.CorruptFileError:
+            logger.exception("Failed to load %s from Redis", key)
+            return default
+
+    def save_json(self, key: str, data):
+        self.client.pipeline(
+            [
+                ("SET", self._key("json", key), storage.encode(data)),
+                ("INCR", self._key("json", key, "version")),
+            ]
+        )
+
+    def json_version(self, key: str):
+        return self.client.execute("GET", self._key("json", key, "version"))
+
+    # Counters
+
+    def incr_counters(self, deltas: dict):
+        key = self._key("counters")
+        self.client.pipeline(
+            [("HINCRBY", key, name, amount) for name, amount in deltas.items()]
+        )
+
+    def get_counters(self) -> dict:
+        flat = self.client.execute("HGETALL", self._key("counters"))
+        return {
+            flat[i].decode(): int(flat[i + 1]) for i in range(0, len(flat), 2)
+        }
+
+    # Integer member sets, stored as sorted sets scored by the member
+
+    def add_member(self, key: str, member: int) -> bool:
+        return self.client.execute("ZADD", self._key("set", key), member, member) == 1
+
+    def add_members(self, key: str, members):
+        members = list(members)
+        for start in range(0, len(members), 1000):
+            args = ["ZADD", self._key("set", key)]
+            for member in members[start:start + 1000]:
+                args += [member, member]
+            self.client.execute(*args)
+
+    def remove_member(self, key: str, member: int) -> bool:
+        return self.client.execute("ZREM", self._key("set", key), member) == 1
+
+    def has_member(self, key: str, member: int) -> bool:
+        return self.client.execute("ZSCORE", self._key("set", key), member) is not None
+
+    def count_members(self, key: str) -> int:
+        return self.client.execute("ZCARD", self._key("set", key))
+
+    def scan_members(self, key: str, after=None, limit: int = 500) -> list:
+        low = "-inf" if after is None else f"({after}"
+        rows = self.client.execute(
+            "ZRANGEBYSCORE", self._key("set", key), low, "+inf", "LIMIT", 0, limit
+        )
+        return [int(member) for member in rows]
+
+    # String hashes
+
+    def read_through(self, key: str):
+        """Hashes are never cached locally; kept for FileBackend parity."""
+
+    def hget(self, key: str, field: str):
+        value = self.client.execute("HGET", self._key("hash", key), field)
+        return value.decode() if value is not None else None
+
+    def hgetall(self, key: str) -> dict:
+        flat = self.client.execute("HGETALL", self._key("hash", key))
+        return {flat[i].decode(): flat[i + 1].decode() for i in range(0, len(flat), 2)}
+
+    def hset(self, key: str, field: str, value: str):
+        self.client.execute("HSET", self._key("hash", key), field, value)
+
+    def hdel(self, key: str, field: str):
+        self.client.execute("HDEL", self._key("hash", key), field)
+
+    def hincr(self, key: str, deltas: dict):
+        """Add integer ``deltas`` to the hash's fields."""
+        key = self._key("hash", key)
+        self.client.pipeline(
+            [("HINCRBY", key, field, amount) for field, amount in deltas.items()]
+        )
+
+    def delete_hash(self, key: str):
+        self.client.execute("DEL", self._key("hash", key))
+
+    # Short-lived values and job queues
+
+    def set_value(self, key: str, value: str, ttl: float):
+        self.client.execute("SET", self._key("value", key), value, "PX", int(ttl * 1000))
+
+    def get_value(self, key: str):
+        value = self.client.execute("GET", self._key("value", key))
+        return value.decode() if value is not None else None
+
+    def push_job(self, queue: str, payload: str):
+        self.client.execute("RPUSH", self._key("queue", queue), payload)
+
+    def pop_job(self, queue: str, timeout: float = 1.0):
+        """Remove and return the oldest job, waiting up to ``timeout`` seconds."""
+        reply = self.client.execute(
+            "BLPOP", self._key("queue", queue), max(1, int(timeout))
+        )
+        return reply[1].decode() if reply else None
+
+    # Leases
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease; return True if ``owner`` holds it now."""
+        key = self._key("lease", name)
+        ttl_ms = int(ttl * 1000)
+        if self.client.execute("SET", key, owner, "NX", "PX", ttl_ms) == "OK":
+            return True
+        return self.client.execute("EVAL", RENEW_LEASE_SCRIPT, 1, key, owner, ttl_ms) == 1
+
+    def release_lease(self, name: str, owner: str):
+        key = self._key("lease", name)
+        self.client.execute("EVAL", RELEASE_LEASE_SCRIPT, 1, key, owner)
+
+    def close(self):
+        self.client.close()
+
+
+def create_backend():
+    """Return a new backend of the kind selected by STATE_BACKEND."""
+    if STATE_BACKEND == "redis":
+        logger.info("Using Redis state backend at %s", REDIS_URL)
+        return RedisBackend()
+    if STATE_BACKEND == "file":
+        return FileBackend()
+    raise RuntimeError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}")
+
+
+def get_backend():
+    """Return the process-wide backend selected by STATE_BACKEND."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
@@ -0,0 +1,75 @@
+"""In-memory usage counters flushed to the state backend in batches."""
+
+import os
+import logging
+import threading
+
+from bot_utils import load_json
+
+logger = logging.getLogger(__name__)
+
+
+class StatsStore:
+    """Counters kept in memory; only the accumulated deltas hit the backend.
+
+    ``increment`` is a dict update, ``flush`` adds all pending deltas in
+    one round trip. Reads are answered from the in-memory totals, which a
+    shared backend refreshes on every flush so they include other replicas.
+    ``flush`` may run in a thread; the lock only covers the dict swaps.
+    """
+
+    def __init__(self, backend, legacy_json=None):
+        self.backend = backend
+        if legacy_json:
+            self._migrate(legacy_json)
+        self.totals = backend.get_counters()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def _migrate(self, path):
+        """Import counters from the old stats.json once, then retire the file."""
+        if not os.path.exists(path):
+            return
+        if self.backend.get_counters():
+            return
+        data = load_json(path, {"starts": 0, "signs": {}})
+        counters = {"starts": data.get("starts", 0)}
+        for code, n in data.get("signs", {}).items():
+            counters[f"sign:{code}"] = n
+        self.backend.incr_counters(counters)
+        os.replace(path, path + ".migrated")
+        logger.info("Migrated %d counters from %s", len(counters), path)
+
+    def increment(self, name, amount: int = 1):
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+            self.pending[name] = self.pending.get(name, 0) + amount
+
+    def get(self, name) -> int:
+        return self.totals.get(name, 0)
+
+    def flush(self) -> int:
+        """Write pending deltas to the backend and return how many were written."""
+        if not self.pending and not self.backend.shared:
+            return 0
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        try:
+            if pending:
+                self.backend.incr_counters(pending)
+            if self.backend.shared:
+                totals = self.backend.get_counters()
+                with self.lock:
+                    for name, amount in self.pending.items():
+                        totals[name] = totals.get(name, 0) + amount
+                    self.totals = totals
+        except Exception:
+            logger.exception("Failed to flush stats")
+            with self.lock:
+                for name, amount in pending.items():
+                    self.pending[name] = self.pending.get(name, 0) + amount
+            return 0
+        return len(pending)
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,142 @@
+"""Crash-safe JSON state files.
+
+Files are written to a temporary file, fsynced and renamed over the
+target, so readers see either the old or the new content, never a
+truncated one. Each file starts with a one-line header carrying a
+SHA-256 of the compact JSON payload that follows; the previous good
+version is kept next to it as ``<name>.bak`` and used when the checksum
+does not match. Plain JSON files written before this format are still
+read (without verification).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "crisis-navigator-json"
+FORMAT_VERSION = 1
+
+
+class CorruptFileError(ValueError):
+    """Raised when a state file fails its checksum or can't be parsed."""
+
+
+def backup_path(path) -> str:
+    return path + ".bak"
+
+
+def encode(data) -> bytes:
+    """Return the header line plus compact JSON payload for ``data``."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    header = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "length": len(payload),
+    }
+    return json.dumps(header).encode("ascii") + b"\n" + payload
+
+
+def decode(raw: bytes):
+    """Parse bytes produced by ``encode`` (or legacy plain JSON)."""
+    header_line, sep, payload = raw.partition(b"\n")
+    try:
+        header = json.loads(header_line) if sep else None
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        # Legacy pretty-printed file without a header
+        try:
+            return json.loads(raw)
+        except ValueError as exc:
+            raise CorruptFileError(str(exc)) from exc
+    if header.get("version", 0) > FORMAT_VERSION:
+        raise CorruptFileError(f"unsupported format version {header['version']}")
+    if (
+        len(payload) != header.get("length")
+        or hashlib.sha256(payload).hexdigest() != header.get("sha256")
+    ):
+        raise CorruptFileError("checksum mismatch")
+    try:
+        return json.loads(payload)
+    except ValueError as exc:
+        raise CorruptFileError(str(exc)) from exc
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _keep_backup(path):
+    """Make the current file the last good copy without ever removing ``path``."""
+    backup = backup_path(path)
+    staging = backup + ".tmp"
+    try:
+        if os.path.exists(staging):
+            os.remove(staging)
+        os.link(path, staging)
+    except OSError:
+        shutil.copyfile(path, staging)
+    os.replace(staging, backup)
+
+
+def atomic_write(path, raw: bytes, keep_backup: bool = True):
+    """Write ``raw`` to ``path`` via temp file + fsync + rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        if keep_backup and os.path.exists(path):
+            _keep_backup(path)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+
+
+def write_json(path, data, keep_backup: bool = True):
+    """Atomically write ``data`` to ``path`` in the checksummed compact format."""
+    atomic_write(path, encode(data), keep_backup)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+
+def read_json(path, default):
+    """Read a state file, falling back to its backup if it is damaged.
+
+    Returns ``default`` only when neither copy exists or both are damaged.
+    """
+    for candidate in (path, backup_path(path)):
+        if not os.path.exists(candidate):
+            continue
+        try:
+            return _read(candidate)
+        except (OSError, CorruptFileError):
+            logger.exception("Failed to load %s", candidate)
+    return default
@@ -0,0 +1,185 @@
+"""Local stand-in for the OpenAI chat-completions endpoint.
+
+Run it and point the generator at it:
+
+    python stub_openai_server.py --port 8089 --latency 0.5 --rate-limit-every 5
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub \\
+        python generate_horoscopes.py meme
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+STUB_TEXT = (
+    "Сегодня ты как кружка, которую так и не помыл: вроде бы мелочь, "
+    "а настроение всё равно поднимает. Разреши себе пятнадцать минут мемов! "
+) * 8
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "StubOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _send_json(self, status: int, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting
+            pass
+
+    def _send_stream(self, request, number: int):
+        """Answer ``stream: true`` requests with server-sent event chunks."""
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        base = {
+            "id": f"chatcmpl-stub-{number}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+        }
+
+        def event(choices, **extra):
+            payload = dict(base, choices=choices, **extra)
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.wfile.write(b"data: " + data + b"\n\n")
+            self.wfile.flush()
+
+        time.sleep(server.latency)
+        size = server.chunk_chars
+        try:
+            event([{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}])
+            for start in range(0, len(STUB_TEXT), size):
+                delta = {"content": STUB_TEXT[start:start + size]}
+                event([{"index": 0, "delta": delta, "finish_reason": None}])
+                time.sleep(server.chunk_delay)
+            event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": 500, "completion_tokens": 300, "total_tokens": 800}
+                event([], usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early
+            pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        server = self.server
+        number = next(server.counter)
+        if server.rate_limit_every and number % server.rate_limit_every == 0:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                {"retry-after": str(server.retry_after)},
+            )
+            return
+        if request.get("stream"):
+            self._send_stream(request, number)
+            return
+        chunks = -(-len(STUB_TEXT) // server.chunk_chars)
+        time.sleep(server.latency + server.chunk_delay * chunks)
+        self._send_json(
+            200,
+            {
+                "id": f"chatcmpl-stub-{number}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": STUB_TEXT},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 500,
+                    "completion_tokens": 300,
+                    "total_tokens": 800,
+                },
+            },
+        )
+
+
+def start_stub_server(
+    port: int = 0,
+    latency: float = 0.0,
+    rate_limit_every: int = 0,
+    retry_after: float = 1.0,
+    chunk_delay: float = 0.0,
+    chunk_chars: int = 20,
+):
+    """Start the stub server in a daemon thread and return it.
+
+    ``latency`` is the delay before the answer (or its first streamed
+    chunk); streamed answers then send ``chunk_chars`` characters every
+    ``chunk_delay`` seconds, and plain answers wait as long as the whole
+    stream would take. ``server.server_address`` holds the bound
+    address; call ``server.shutdown()`` to stop it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.rate_limit_every = rate_limit_every
+    server.retry_after = retry_after
+    server.chunk_delay = chunk_delay
+    server.chunk_chars = chunk_chars
+    server.counter = itertools.count(1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument(
+        "--rate-limit-every",
+        type=int,
+        default=0,
+        help="answer every N-th request with 429",
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument(
+        "--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = start_stub_server(
+        args.port,
+        args.latency,
+        args.rate_limit_every,
+        args.retry_after,
+        args.chunk_delay,
+    )
+    logger.info("Stub OpenAI server listening on %s:%s", *server.server_address)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
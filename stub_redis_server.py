@@ -0,0 +1,334 @@
+"""In-process stand-in for a Redis server, enough for RedisBackend.
+
+Speaks RESP2 over TCP and keeps data in memory. Run two bot replicas
+against it to try the shared backend without a real Redis:
+
+    python stub_redis_server.py --port 6390
+    STATE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 python bot.py
+"""
+
+import argparse
+import bisect
+import collections
+import logging
+import re
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The only scripts EVAL runs: call a command on KEYS[1] if it holds ARGV[1],
+# which is the shape of RedisBackend's lease scripts
+COMPARE_AND_CALL = re.compile(
+    r"if redis\.call\('GET', KEYS\[1\]\) == ARGV\[1\] then\s+"
+    r"return redis\.call\('(\w+)', KEYS\[1\]((?:, ARGV\[\d+\])*)\)\s+"
+    r"end\s+return 0$"
+)
+
+
+class CommandError(Exception):
+    pass
+
+
+class StubStore:
+    """Strings, hashes, lists and sorted sets with key expiry."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _typed(self, key, kind):
+        value = self._live(key)
+        if value is None:
+            return None
+        if not isinstance(value, kind):
+            raise CommandError("WRONGTYPE key holds the wrong kind of value")
+        return value
+
+    def execute(self, name, args):
+        if name.upper() == "BLPOP":
+            return self.blpop(*args)
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{name}'")
+        with self.lock:
+            return handler(*args)
+
+    def blpop(self, *args):
+        """Poll the lists without holding the lock so other clients proceed."""
+        *keys, timeout = args
+        deadline = time.monotonic() + float(timeout)
+        while True:
+            with self.lock:
+                for key in keys:
+                    value = self.cmd_lpop(key)
+                    if value is not None:
+                        return [key, value]
+            if float(timeout) and time.monotonic() >= deadline:
+                return None
+            time.sleep(0.01)
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_flushall(self):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    def cmd_get(self, key):
+        return self._typed(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        exists = self._live(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for flag, scale in ((b"PX", 0.001), (b"EX", 1.0)):
+            if flag in options:
+                ttl = float(options[options.index(flag) + 1]) * scale
+                self.expires[key] = time.monotonic() + ttl
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key) is not None:
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_pexpire(self, key, ttl):
+        if self._live(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(ttl) / 1000
+        return 1
+
+    def cmd_eval(self, script, numkeys, *args):
+        """Run a compare-and-call script atomically, under the store lock."""
+        match = COMPARE_AND_CALL.match(script.decode().strip())
+        if match is None:
+            raise CommandError("ERR the stub only runs compare-and-call scripts")
+        keys, argv = args[: int(numkeys)], args[int(numkeys):]
+        if self.cmd_get(keys[0]) != argv[0]:
+            return 0
+        extra = [argv[int(n) - 1] for n in re.findall(r"ARGV\[(\d+)\]", match.group(2))]
+        return getattr(self, "cmd_" + match.group(1).lower())(keys[0], *extra)
+
+    def cmd_incrby(self, key, amount):
+        value = int(self._typed(key, bytes) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def _hash(self, key):
+        value = self._typed(key, dict)
+        if value is None:
+            value = self.data[key] = {}
+        return value
+
+    def cmd_hget(self, key, field):
+        return (self._typed(key, dict) or {}).get(field)
+
+    def cmd_hset(self, key, *pairs):
+        values = self._hash(key)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in values
+            values[field] = value
+        return added
+
+    def cmd_hdel(self, key, *fields):
+        values = self._typed(key, dict) or {}
+        return sum(values.pop(field, None) is not None for field in fields)
+
+    def cmd_hincrby(self, key, field, amount):
+        values = self._hash(key)
+        value = int(values.get(field, 0)) + int(amount)
+        values[field] = str(value).encode()
+        return value
+
+    def cmd_hgetall(self, key):
+        values = self._typed(key, dict) or {}
+        return [item for pair in values.items() for item in pair]
+
+    def _list(self, key):
+        value = self._typed(key, collections.deque)
+        if value is None:
+            value = self.data[key] = collections.deque()
+        return value
+
+    def cmd_rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(values)
+        return len(items)
+
+    def cmd_lpop(self, key):
+        items = self._typed(key, collections.deque)
+        if not items:
+            return None
+        value = items.popleft()
+        if not items:
+            del self.data[key]
+        return value
+
+    def cmd_llen(self, key):
+        return len(self._typed(key, collections.deque) or ())
+
+    # Sorted sets are kept as a sorted list of (score, member) plus a dict
+
+    def _zset(self, key):
+        value = self._typed(key, tuple)
+        if value is None:
+            value = self.data[key] = ([], {})
+        return value
+
+    def cmd_zadd(self, key, *pairs):
+        entries, scores = self._zset(key)
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            score = float(score)
+            if member in scores:
+                entries.remove((scores[member], member))
+            else:
+                added += 1
+            scores[member] = score
+            bisect.insort(entries, (score, member))
+        return added
+
+    def cmd_zrem(self, key, *members):
+        entries, scores = self._typed(key, tuple) or ([], {})
+        removed = 0
+        for member in members:
+            if member in scores:
+                entries.remove((scores.pop(member), member))
+                removed += 1
+        return removed
+
+    def cmd_zscore(self, key, member):
+        _, scores = self._typed(key, tuple) or ([], {})
+        score = scores.get(member)
+        return None if score is None else repr(score).encode()
+
+    def cmd_zcard(self, key):
+        _, scores = self._typed(key, tuple) or ([], {})
+        return len(scores)
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        entries, _ = self._typed(key, tuple) or ([], {})
+        low, low_open = _score_bound(low)
+        high, high_open = _score_bound(high)
+        offset, count = 0, None
+        if options and options[0].upper() == b"LIMIT":
+            offset, count = int(options[1]), int(options[2])
+        find = bisect.bisect_right if low_open else bisect.bisect_left
+        start = find(entries, low, key=lambda entry: entry[0])
+        result = []
+        for score, member in entries[start:]:
+            if score > high or (high_open and score == high):
+                break
+            result.append(member)
+        result = result[offset:]
+        return result if count is None or count < 0 else result[:count]
+
+
+def _score_bound(raw: bytes):
+    """Parse a ZRANGEBYSCORE bound such as ``-inf`` or ``(42``."""
+    raw = raw.decode()
+    if raw.startswith("("):
+        return float(raw[1:]), True
+    return float(raw), False
+
+
+def _encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, CommandError):
+        return b"-" + str(reply).encode() + b"\r\n"
+    if isinstance(reply, str):
+        return b"+" + reply.encode() + b"\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(item) for item in reply)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            if not command:
+                continue
+            try:
+                reply = store.execute(command[0].decode(), command[1:])
+            except CommandError as exc:
+                reply = exc
+            except (ValueError, TypeError, IndexError) as exc:
+                reply = CommandError(f"ERR {exc}")
+            self.wfile.write(_encode(reply))
+
+
+class StubRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_stub_server(port: int = 0, addr: str = "127.0.0.1"):
+    """Start the stand-in in a daemon thread and return the server."""
+    server = StubRedisServer((addr, port), RespHandler)
+    server.store = StubStore()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = start_stub_server(args.port)
+    logger.info("Stub Redis server listening on %s:%s", *server.server_address)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Local stand-in for the parts of the Telegram Bot API the updater uses.
+
+Answers getMe, setWebhook, deleteWebhook and getUpdates, so a real
+Application can poll a queue of synthetic updates without the network:
+
+    server = start_stub_server(poll_rtt=0.05)
+    server.add_updates(updates)
+    builder.token("0:stub").base_url(f"http://127.0.0.1:{server.server_address[1]}/bot")
+"""
+
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Stub",
+    "username": "stub_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+def _parameters(body: bytes, content_type: str) -> dict:
+    """Decode a Bot API request; form values are JSON encoded unless strings."""
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    parameters = {}
+    for key, value in parse_qsl(body.decode("utf-8")):
+        try:
+            parameters[key] = json.loads(value)
+        except ValueError:
+            parameters[key] = value
+    return parameters
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "StubTelegram/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting
+            pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        parameters = _parameters(
+            self.rfile.read(length), self.headers.get("Content-Type", "")
+        )
+        method = self.path.rsplit("/", 1)[-1]
+        server = self.server
+        if method == "getMe":
+            result = BOT_USER
+        elif method in ("setWebhook", "deleteWebhook", "close"):
+            result = True
+        elif method == "getUpdates":
+            result = server.take_updates(
+                parameters.get("offset", 0),
+                parameters.get("limit", 100),
+                parameters.get("timeout", 0),
+            )
+        else:
+            self._send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+        self._send_json(200, {"ok": True, "result": result})
+
+
+class StubTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, poll_rtt: float):
+        super().__init__(address, StubHandler)
+        self.poll_rtt = poll_rtt
+        self.pending = []
+        self.condition = threading.Condition()
+
+    def add_updates(self, updates):
+        """Queue update dicts for getUpdates."""
+        with self.condition:
+            self.pending.extend(updates)
+            self.condition.notify_all()
+
+    def take_updates(self, offset: int, limit: int, timeout: float) -> list:
+        """Confirm updates below ``offset`` and return the next batch.
+
+        Like the Bot API, waits up to ``timeout`` seconds for updates when
+        none are pending; every answer takes at least ``poll_rtt``.
+        """
+        time.sleep(self.poll_rtt)
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            while not self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.pending[:limit]
+
+
+def start_stub_server(port: int = 0, poll_rtt: float = 0.0):
+    """Start the stub server in a daemon thread and return it.
+
+    ``server.server_address`` holds the bound address; call
+    ``server.shutdown()`` to stop it.
+    """
+    server = StubTelegramServer(("127.0.0.1", port), poll_rtt)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
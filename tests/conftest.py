@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level settings are read on import, so point all state at a scratch
+# directory before any test imports the bot's modules
+_STATE = tempfile.mkdtemp(prefix="horoscope-tests-")
+os.environ["STATE_DIR"] = _STATE
+os.environ["BOT_DB"] = os.path.join(_STATE, "bot.db")
+os.environ["STATE_BACKEND"] = "file"
+os.environ["GENERATION_WORKER"] = "inline"
+os.environ["OPENAI_API_KEY"] = "stub"
+os.environ.setdefault("TELEGRAM_TOKEN", "0:test")
@@ -0,0 +1,78 @@
+import datetime
+import types
+
+import pytest
+
+import analytics
+from analytics import DAY, HOUR, Analytics
+from state_backend import FileBackend
+
+# HOROSCOPE_TZ for these tests: three hours ahead of UTC, no DST
+TZ = datetime.timezone(datetime.timedelta(hours=3))
+
+
+def at(*parts) -> float:
+    return datetime.datetime(*parts, tzinfo=TZ).timestamp()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [at(2030, 3, 10, 12, 0)]
+    monkeypatch.setattr(analytics, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = FileBackend(str(tmp_path / "bot.db"), str(tmp_path))
+    yield backend
+    backend.close()
+
+
+def test_hourly_counts_roll_up_into_the_local_day(clock, backend):
+    usage = Analytics(backend, TZ)
+    # 23:30 and 23:50 on the 10th, 00:10 on the 11th in TZ (20:30-21:10 UTC)
+    for moment in (at(2030, 3, 10, 23, 30), at(2030, 3, 10, 23, 50), at(2030, 3, 11, 0, 10)):
+        clock[0] = moment
+        usage.record("sign", "meme", "leo")
+    usage.flush()
+
+    days = usage.buckets(DAY, 2)
+    assert [counts for _, counts in days] == [{"sign:meme:leo": 2}, {"sign:meme:leo": 1}]
+    assert days[1][0] == datetime.date(2030, 3, 11).toordinal()
+    hours = usage.buckets(HOUR, 2)
+    assert [usage.local_hour(bucket) for bucket, _ in hours] == [23, 0]
+    assert [counts for _, counts in hours] == [{"sign:meme:leo": 2}, {"sign:meme:leo": 1}]
+    assert usage.totals(DAY, 1) == {"sign:meme:leo": 1}
+    assert usage.hours_today() == 1
+
+
+def test_unflushed_counts_are_included_in_queries(clock, backend):
+    usage = Analytics(backend, TZ)
+    usage.record("start")
+    usage.flush()
+    usage.record("start")
+
+    assert usage.totals(HOUR, 1) == {"start": 2}
+    assert usage.totals(DAY, 1) == {"start": 2}
+
+
+def test_buckets_past_retention_are_pruned_on_flush(clock, backend):
+    usage = Analytics(backend, TZ, hourly_retention=2, daily_retention=1)
+    start = clock[0]
+    for hour in range(4):
+        clock[0] = start + hour * 3600
+        usage.record("start")
+        usage.flush()
+
+    current = int(clock[0] // 3600)
+    assert backend.scan_members("analytics:hours", None, 100) == [current - 1, current]
+    assert backend.hgetall(Analytics._key(HOUR, current - 3)) == {}
+    assert usage.totals(HOUR, 10) == {"start": 2}
+
+    clock[0] = at(2030, 3, 11, 12, 0)
+    usage.record("start")
+    usage.flush()
+    today = datetime.date(2030, 3, 11).toordinal()
+    assert backend.scan_members("analytics:days", None, 100) == [today]
+    assert backend.hgetall(Analytics._key(DAY, today - 1)) == {}
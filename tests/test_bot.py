@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import types
+
+import pytest
+
+import analytics
+import bot
+from fake_telegram import FakeApplication, FakeBot, FakeContext, FakeUpdate
+from state_backend import FileBackend
+
+
+def test_sign_tap_after_a_queued_mode_switch_is_not_coalesced():
+    fake_bot = FakeBot()
+    chat = 501
+    bot._remember_mode(chat, "meme")
+
+    async def admit(text):
+        return await bot.admit_update(FakeUpdate(fake_bot, chat, text))
+
+    async def scenario():
+        # the switch is admitted but its handler hasn't run yet
+        verdicts = [await admit(text) for text in ("Лев", "Нормальный гороскоп", "Лев")]
+        pending = dict(bot.pending_modes)
+        update = FakeUpdate(fake_bot, chat, "Нормальный гороскоп")
+        await bot.handle_message(update, FakeContext(FakeApplication(fake_bot)))
+        # once applied, a repeat in the new mode is coalesced again
+        verdicts.append(await admit("Лев"))
+        return verdicts, pending
+
+    verdicts, pending = asyncio.run(scenario())
+    assert verdicts == [True, True, True, False]
+    assert pending == {chat: "normal"}
+    assert chat not in bot.pending_modes
+    assert bot.cached_user_mode(chat) == "normal"
+
+
+@pytest.fixture
+def usage(tmp_path, monkeypatch):
+    tz = datetime.timezone(datetime.timedelta(hours=3))
+    now = [datetime.datetime(2030, 3, 11, 2, 30, tzinfo=tz).timestamp()]
+    monkeypatch.setattr(analytics, "time", types.SimpleNamespace(time=lambda: now[0]))
+    backend = FileBackend(str(tmp_path / "bot.db"), str(tmp_path))
+    usage = analytics.Analytics(backend, tz)
+    monkeypatch.setattr(bot, "usage", usage)
+    usage.now = now
+    yield usage
+    backend.close()
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["today"], (analytics.DAY, 1, None)),
+        (["7d"], (analytics.DAY, 7, None)),
+        (["24h", "by", "sign"], (analytics.HOUR, 24, "sign")),
+        (["TODAY", "BY", "MODE"], (analytics.DAY, 1, "mode")),
+        # 02:30: today is the 00, 01 and 02 o'clock buckets
+        (["today", "by", "hour"], (analytics.HOUR, 3, "hour")),
+        (["2d", "by", "hour"], (analytics.HOUR, 27, "hour")),
+        (["6h", "by", "hour"], (analytics.HOUR, 6, "hour")),
+    ],
+)
+def test_parse_stats_query(usage, args, expected):
+    assert bot.parse_stats_query(args) == expected
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        [],
+        ["yesterday"],
+        ["7"],
+        ["d"],
+        ["-1d"],
+        ["7w"],
+        ["7d", "by"],
+        ["7d", "by", "user"],
+        ["7d", "24h"],
+    ],
+)
+def test_parse_stats_query_rejects_invalid_ranges(usage, args):
+    assert bot.parse_stats_query(args) is None
+
+
+def test_format_stats_by_hour_covers_only_today(usage):
+    tz = usage.tz
+    events = [
+        (datetime.datetime(2030, 3, 10, 23, 15), "meme", "leo"),
+        (datetime.datetime(2030, 3, 11, 0, 5), "meme", "leo"),
+        (datetime.datetime(2030, 3, 11, 2, 0), "normal", "aries"),
+        (datetime.datetime(2030, 3, 11, 2, 10), "meme", "aries"),
+    ]
+    for moment, mode, sign in events:
+        usage.now[0] = moment.replace(tzinfo=tz).timestamp()
+        usage.record("sign", mode, sign)
+    usage.record("start")
+    usage.flush()
+
+    assert bot.format_stats(*bot.parse_stats_query(["today", "by", "hour"])) == [
+        "00:00 — 1",
+        "02:00 — 2",
+    ]
+    lines = bot.format_stats(*bot.parse_stats_query(["2d", "by", "mode"]))
+    assert lines[:3] == ["Стартов: 1", "Гороскопов: 4", "Напоминания: +0 / -0"]
+    assert lines[3:] == [f"{bot.MODE_NAMES['meme']}: 3", f"{bot.MODE_NAMES['normal']}: 1"]
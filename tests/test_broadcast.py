@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from broadcast import BroadcastCheckpoint, broadcast
+from fake_telegram import FakeBot
+from reminder_store import ReminderStore
+from state_backend import FileBackend
+
+
+@pytest.fixture
+def store(tmp_path):
+    backend = FileBackend(str(tmp_path / "bot.db"), str(tmp_path))
+    store = ReminderStore(backend)
+    for chat_id in range(1, 11):
+        store.subscribe(chat_id)
+    yield store
+    backend.close()
+
+
+class CrashingBot(FakeBot):
+    """Stops the broadcast, as a restart would, when it reaches a chat."""
+
+    def __init__(self, crash_at):
+        super().__init__()
+        self.crash_at = crash_at
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == self.crash_at:
+            raise asyncio.CancelledError
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+def test_interrupted_broadcast_resumes_after_the_last_batch(store):
+    checkpoint = BroadcastCheckpoint(store.backend, "reminders")
+    options = dict(run_id="2030-01-01", checkpoint=checkpoint, rate=1000, batch_size=3)
+
+    async def scenario():
+        crashed = CrashingBot(crash_at=5)
+        with pytest.raises(asyncio.CancelledError):
+            await broadcast(crashed, store.iter_chats, "hi", **options)
+        resumed = FakeBot()
+        report = await broadcast(resumed, store.iter_chats, "hi", **options)
+        again = await broadcast(FakeBot(), store.iter_chats, "hi", **options)
+        return crashed, resumed, report, again
+
+    crashed, resumed, report, again = asyncio.run(scenario())
+    assert [chat for chat, _, _ in crashed.sent][:3] == [1, 2, 3]
+    # the batch in flight is sent again: delivery is at least once
+    assert sorted(chat for chat, _, _ in resumed.sent) == list(range(4, 11))
+    assert report["sent"] == 7
+    assert checkpoint.load("2030-01-01") == (10, True)
+    assert again["skipped"]
+
+
+def test_blocked_and_missing_chats_are_unsubscribed(store):
+    bot = FakeBot(blocked={2, 7}, missing={9})
+
+    report = asyncio.run(
+        broadcast(
+            bot, store.iter_chats, "hi", run_id="2030-01-01", on_gone=store.unsubscribe, rate=1000
+        )
+    )
+
+    assert report["sent"] == 7
+    assert report["gone"] == 3
+    assert report["failed"] == 0
+    assert list(store.iter_chats()) == [1, 3, 4, 5, 6, 8, 10]
@@ -0,0 +1,97 @@
+import io
+import json
+
+import pytest
+
+import edit_text
+
+LONG = "Овен. " * 300
+
+
+def test_edit_lines_trims_a_dotted_field():
+    lines = [json.dumps({"date": "2030-03-11", "horoscopes": {"aries": LONG}}) + "\n"]
+
+    text, records, changed, skipped = edit_text.edit_lines(lines, "horoscopes.aries")
+
+    record = json.loads(text)
+    assert record["date"] == "2030-03-11"
+    assert len(record["horoscopes"]["aries"]) <= 1000
+    assert record["horoscopes"]["aries"].endswith(".")
+    assert (records, changed, skipped) == (1, 1, 0)
+
+
+def test_edit_lines_passes_through_records_without_a_string_field():
+    lines = [
+        json.dumps({"horoscopes": {"leo": LONG}}) + "\n",
+        json.dumps({"horoscopes": {"aries": 42}}) + "\n",
+        json.dumps({"horoscopes": "aries"}) + "\n",
+        "not json\n",
+        "\n",
+        json.dumps({"horoscopes": {"aries": "Коротко."}}) + "\n",
+    ]
+
+    text, records, changed, skipped = edit_text.edit_lines(lines, "horoscopes.aries")
+
+    assert text == "".join(lines)
+    assert (records, changed, skipped) == (5, 0, 4)
+
+
+def test_edit_lines_with_telegram_limit_keeps_surrogate_pairs():
+    lines = [json.dumps({"text": "a" * 9 + "🌟" + "b"}, ensure_ascii=False) + "\n"]
+
+    text, _, changed, _ = edit_text.edit_lines(lines, "text", telegram_limit=10)
+
+    assert json.loads(text) == {"text": "a" * 9}
+    assert changed == 1
+
+
+def _write_jsonl(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": i, "meta": {"text": LONG}}, ensure_ascii=False) + "\n")
+
+
+def _no_pool(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError("process pool started")
+
+    monkeypatch.setattr(edit_text.concurrent.futures, "ProcessPoolExecutor", refuse)
+
+
+def test_run_trims_a_single_batch_inline(tmp_path, monkeypatch):
+    path = tmp_path / "export.jsonl"
+    _write_jsonl(path, 3)
+    _no_pool(monkeypatch)
+    out = io.StringIO()
+
+    stats = edit_text.run(
+        edit_text.parse_args([str(path), "--field", "meta.text", "--jobs", "4"]), out
+    )
+
+    assert stats == {"records": 3, "changed": 3, "skipped": 0}
+    assert [json.loads(line)["id"] for line in out.getvalue().splitlines()] == [0, 1, 2]
+
+
+def test_run_trims_a_single_plain_file_inline(tmp_path, monkeypatch):
+    path = tmp_path / "aries.txt"
+    path.write_text(LONG, encoding="utf-8")
+    _no_pool(monkeypatch)
+    out = io.StringIO()
+
+    stats = edit_text.run(edit_text.parse_args([str(path), "--jobs", "4"]), out)
+
+    assert stats["changed"] == 1
+    assert out.getvalue() == edit_text.trim_text(LONG)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_run_keeps_input_order_across_batches(tmp_path, jobs):
+    path = tmp_path / "export.jsonl"
+    _write_jsonl(path, 25)
+    out = io.StringIO()
+    argv = [str(path), "--field", "meta.text", "--jobs", jobs, "--batch-size", "4"]
+
+    stats = edit_text.run(edit_text.parse_args(argv), out)
+
+    assert stats == {"records": 25, "changed": 25, "skipped": 0}
+    assert [json.loads(line)["id"] for line in out.getvalue().splitlines()] == list(range(25))
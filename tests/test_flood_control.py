@@ -0,0 +1,67 @@
+from flood_control import ADMIT, COALESCED, NOTIFY, SHED, FloodControl
+
+
+def test_sliding_window_limits_each_chat():
+    flood = FloodControl(max_requests=3, window=10, coalesce_seconds=5)
+
+    assert [flood.check(1, now=t) for t in (0, 1, 2)] == [ADMIT] * 3
+    assert flood.check(1, now=3) == NOTIFY
+    # another chat has its own window
+    assert flood.check(2, now=3) == ADMIT
+    # the first message leaves the window at t=10
+    assert flood.check(1, now=9.9) == SHED
+    assert flood.check(1, now=10) == ADMIT
+    assert flood.check(1, now=10.5) == NOTIFY
+
+
+def test_one_notice_per_burst():
+    flood = FloodControl(max_requests=1, window=10)
+
+    verdicts = [flood.check(1, now=t) for t in (0, 1, 2, 3)]
+    assert verdicts == [ADMIT, NOTIFY, SHED, SHED]
+    assert flood.check(1, now=11) == ADMIT
+    # an admitted message starts a new burst, which gets its own notice
+    assert flood.check(1, now=12) == NOTIFY
+    assert flood.stats == {
+        "admitted": 2,
+        "coalesced": 0,
+        "shed": 4,
+        "notices": 2,
+        "evicted": 0,
+    }
+
+
+def test_repeats_are_coalesced_without_counting_against_the_limit():
+    flood = FloodControl(max_requests=2, window=60, coalesce_seconds=5)
+
+    assert flood.check(1, ("meme", "leo"), now=0) == ADMIT
+    assert flood.check(1, ("meme", "leo"), now=1) == COALESCED
+    assert flood.check(1, ("normal", "leo"), now=2) == ADMIT
+    assert flood.check(1, ("meme", "leo"), now=4.9) == COALESCED
+    # once the coalescing period is over the repeat is a new request
+    assert flood.check(1, ("meme", "leo"), now=5) == NOTIFY
+    assert flood.stats["coalesced"] == 2
+
+
+def test_idle_chats_are_evicted_least_recently_seen_first():
+    flood = FloodControl(max_requests=5, window=10, coalesce_seconds=10, idle_ttl=100)
+
+    flood.check(1, now=0)
+    flood.check(2, now=50)
+    flood.check(1, now=60)
+    flood.check(3, now=155)
+    # chat 2 was last seen at 50 and chat 1 at 60: only chat 2 is idle
+    assert list(flood.chats) == [1, 3]
+    flood.check(3, now=161)
+    assert list(flood.chats) == [3]
+    assert flood.stats["evicted"] == 2
+
+
+def test_table_never_exceeds_max_chats():
+    flood = FloodControl(idle_ttl=600, max_chats=3)
+
+    for chat in range(5):
+        flood.check(chat, now=chat)
+
+    assert flood.tracked == 3
+    assert list(flood.chats) == [2, 3, 4]
@@ -0,0 +1,84 @@
+import asyncio
+
+from followup_scheduler import FollowUpScheduler
+
+
+def test_taps_while_pending_are_coalesced(tmp_path):
+    db = str(tmp_path / "bot.db")
+
+    async def scenario():
+        scheduler = FollowUpScheduler(db, delay=0.05)
+        sent = []
+
+        async def send(chat_id):
+            sent.append(chat_id)
+
+        scheduler.start(send)
+        results = [scheduler.schedule(1), scheduler.schedule(1), scheduler.schedule(2)]
+        depth = scheduler.depth
+        await asyncio.sleep(0.2)
+        # once delivered, the next tap schedules a new follow-up
+        again = scheduler.schedule(1)
+        await scheduler.stop()
+        return results, depth, sent, again, scheduler.coalesced
+
+    results, depth, sent, again, coalesced = asyncio.run(scenario())
+    assert results == [True, False, True]
+    assert depth == 2
+    assert sorted(sent) == [1, 2]
+    assert again
+    assert coalesced == 1
+
+
+def test_schedule_writes_nothing_until_flushed(tmp_path):
+    db = str(tmp_path / "bot.db")
+
+    async def scenario():
+        scheduler = FollowUpScheduler(db, delay=60)
+        scheduler.schedule(1)
+        scheduler.schedule(2)
+        before = scheduler.conn.execute("SELECT COUNT(*) FROM followups").fetchone()[0]
+        written = await scheduler.flush()
+        after = scheduler.conn.execute("SELECT COUNT(*) FROM followups").fetchone()[0]
+        await scheduler.stop()
+        return before, written, after
+
+    assert asyncio.run(scenario()) == (0, 2, 2)
+
+
+def test_pending_follow_ups_are_reloaded_after_a_restart(tmp_path):
+    db = str(tmp_path / "bot.db")
+
+    async def first_run():
+        scheduler = FollowUpScheduler(db, delay=0.05, flush_interval=10)
+        sent = []
+
+        async def send(chat_id):
+            sent.append(chat_id)
+
+        scheduler.start(send)
+        scheduler.schedule(2)
+        await scheduler.flush()
+        # chat 2 is delivered, which removes it on the next flush
+        await asyncio.sleep(0.2)
+        scheduler.delay = 60
+        scheduler.schedule(1)
+        scheduler.schedule(3)
+        pending = dict(scheduler.pending)
+        await scheduler.stop()
+        return pending, sent
+
+    pending, sent = asyncio.run(first_run())
+    assert sent == [2]
+
+    async def second_run():
+        scheduler = FollowUpScheduler(db, delay=60)
+        reloaded = dict(scheduler.pending)
+        heap = sorted(scheduler.heap)
+        await scheduler.stop()
+        return reloaded, heap
+
+    reloaded, heap = asyncio.run(second_run())
+    assert reloaded == pending
+    assert set(reloaded) == {1, 3}
+    assert heap == sorted((due, chat) for chat, due in reloaded.items())
@@ -0,0 +1,206 @@
+import asyncio
+import datetime
+import json
+import time
+import types
+
+import pytest
+from openai import RateLimitError
+
+import generate_horoscopes
+import generation_jobs
+import horoscope_utils
+import metrics
+import state_backend
+import stub_openai_server
+from text_utils import trim_text
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    servers = []
+
+    def start(**kwargs):
+        server = stub_openai_server.start_stub_server(**kwargs)
+        servers.append(server)
+        host, port = server.server_address
+        monkeypatch.setenv("OPENAI_BASE_URL", f"http://{host}:{port}/v1")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+async def _request(name):
+    async with generate_horoscopes._client() as client:
+        return await generate_horoscopes._request_horoscope(client, name, "prompt")
+
+
+def test_rate_limited_request_is_retried_after_retry_after(stub):
+    # every second request is answered with 429 and retry-after: 0.2
+    server = stub(rate_limit_every=2, retry_after=0.2)
+    retries = metrics.OPENAI_RETRIES.get()
+
+    async def scenario():
+        await _request("Овен")
+        started = time.monotonic()
+        text = await _request("Телец")
+        return text, time.monotonic() - started
+
+    text, elapsed = asyncio.run(scenario())
+    assert text == stub_openai_server.STUB_TEXT.strip()
+    assert elapsed >= 0.2
+    assert metrics.OPENAI_RETRIES.get() == retries + 1
+    assert next(server.counter) == 4
+
+
+def test_rate_limit_is_raised_once_retries_run_out(stub, monkeypatch):
+    stub(rate_limit_every=1, retry_after=0.01)
+    monkeypatch.setattr(generate_horoscopes, "GENERATION_RETRIES", 2)
+    errors = metrics.OPENAI_ERRORS.get()
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(_request("Овен"))
+    assert metrics.OPENAI_ERRORS.get() == errors + 1
+
+
+def test_single_sign_is_streamed_and_cached(stub):
+    stub(latency=0.05, chunk_delay=0.002)
+    date = "2030-01-01"
+    partials = []
+
+    async def on_text(text):
+        partials.append(text)
+
+    text = asyncio.run(
+        generate_horoscopes.generate_sign_streaming("meme", "leo", date, on_text)
+    )
+
+    assert len(partials) > 10
+    assert all(b.startswith(a) for a, b in zip(partials, partials[1:]))
+    assert stub_openai_server.STUB_TEXT.startswith(partials[-1])
+    assert text == trim_text(partials[-1].strip())
+    cache = horoscope_utils.get_cached("meme", recheck=True)
+    assert horoscope_utils.get_day(cache, date)["horoscopes"] == {"leo": text}
+
+
+def test_concurrent_requesters_share_one_worker_stream(stub, monkeypatch):
+    server = stub(latency=0.1, chunk_delay=0.005)
+    monkeypatch.setattr(generate_horoscopes, "PARTIAL_INTERVAL", 0.01)
+    monkeypatch.setattr(horoscope_utils, "WORKER_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(horoscope_utils, "WORKER_WAIT_TIMEOUT", 10)
+    date = "2030-02-01"
+    backend = state_backend.get_backend()
+
+    async def worker(streams):
+        while True:
+            payload = await asyncio.to_thread(backend.pop_job, generation_jobs.QUEUE, 0.05)
+            if payload is not None:
+                asyncio.ensure_future(generate_horoscopes._run_job(json.loads(payload), streams))
+
+    async def scenario():
+        streams = {}
+        serving = asyncio.ensure_future(worker(streams))
+        seen = {"first": [], "second": []}
+
+        def relay(name):
+            async def on_text(text):
+                seen[name].append(text)
+
+            return horoscope_utils._stream_from_worker("meme", "virgo", date, on_text)
+
+        first = asyncio.ensure_future(relay("first"))
+        while not seen["first"]:
+            await asyncio.sleep(0.01)
+        # the second requester arrives while the stream is running
+        second = await relay("second")
+        first = await first
+        serving.cancel()
+        return first, second, seen
+
+    first, second, seen = asyncio.run(scenario())
+    assert first == second
+    assert seen["second"]
+    assert next(server.counter) == 2
+
+
+def test_pregenerated_day_is_served_after_midnight_in_horoscope_tz(stub, monkeypatch):
+    server = stub()
+    tz = datetime.timezone(datetime.timedelta(hours=3))
+    now = [datetime.datetime(2030, 4, 1, 23, 0, tzinfo=tz)]
+
+    class FrozenDatetime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now[0].astimezone(tz) if tz else now[0].astimezone().replace(tzinfo=None)
+
+    frozen = types.SimpleNamespace(**vars(datetime))
+    frozen.datetime = FrozenDatetime
+    monkeypatch.setattr(horoscope_utils, "datetime", frozen)
+    monkeypatch.setattr(horoscope_utils, "TIMEZONE", tz)
+    monkeypatch.setattr(horoscope_utils, "AHEAD_DAYS", 1)
+
+    assert asyncio.run(horoscope_utils.pregenerate("meme"))
+    requests = next(server.counter) - 1
+    assert requests == 24
+    horoscope_utils.update_day("meme", "2030-04-01", {"leo": "Вчерашний текст"})
+    assert asyncio.run(horoscope_utils.get_horoscope_async("leo", "meme")) == "Вчерашний текст"
+
+    # 00:05 in HOROSCOPE_TZ is still April 1st in UTC
+    now[0] = datetime.datetime(2030, 4, 2, 0, 5, tzinfo=tz)
+    assert now[0].astimezone(datetime.timezone.utc).day == 1
+    assert horoscope_utils.today() == "2030-04-02"
+    text = asyncio.run(horoscope_utils.get_horoscope_async("leo", "meme"))
+
+    assert text == trim_text(stub_openai_server.STUB_TEXT.strip())
+    # each next() takes a number, so this means no request since
+    assert next(server.counter) == requests + 2
+
+
+def test_interrupted_run_resumes_with_only_the_missing_signs(stub, monkeypatch):
+    stub(latency=0.05)
+    monkeypatch.setattr(generate_horoscopes, "GENERATION_CONCURRENCY", 2)
+    date = "2030-05-01"
+    asked = []
+    request = generate_horoscopes._request_horoscope
+
+    async def recording(client, name, prompt):
+        asked.append(generate_horoscopes.ZODIAC_SIGNS[name])
+        return await request(client, name, prompt)
+
+    monkeypatch.setattr(generate_horoscopes, "_request_horoscope", recording)
+
+    def saved():
+        cache = horoscope_utils.get_cached("meme", recheck=True)
+        return set(horoscope_utils.get_day(cache, date).get("horoscopes", {}))
+
+    async def interrupted():
+        run = asyncio.ensure_future(
+            generate_horoscopes.generate_all_horoscopes_async("meme", None, date)
+        )
+        while len(await asyncio.to_thread(saved)) < 4:
+            await asyncio.sleep(0.01)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        # let a checkpoint write already handed to a thread finish
+        await asyncio.sleep(0.2)
+
+    asyncio.run(interrupted())
+    done = saved()
+    assert 4 <= len(done) < 12
+    asked.clear()
+
+    cache = generate_horoscopes.generate_all_horoscopes(date=date)
+
+    day = horoscope_utils.get_day(cache, date)
+    assert set(day["horoscopes"]) == set(generate_horoscopes.ZODIAC_SIGNS.values())
+    assert not done & set(asked)
+    assert len(asked) == len(set(asked))
+    # a sign answered but cancelled before its checkpoint is a response cache hit
+    run = day["run"]
+    assert run["skipped"] == len(done)
+    assert len(asked) + run["cache_hits"] == 12 - len(done)
+    assert run["requested"] == len(asked)
+    assert run["api_calls_saved"] == 12 - len(asked)
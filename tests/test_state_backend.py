@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+import pytest
+
+import stub_redis_server
+from state_backend import FileBackend, RedisBackend
+
+
+@pytest.fixture
+def redis_url():
+    server = stub_redis_server.start_stub_server()
+    host, port = server.server_address
+    yield f"redis://{host}:{port}/0"
+    server.shutdown()
+
+
+@pytest.fixture
+def backends(redis_url):
+    opened = []
+
+    def connect():
+        backend = RedisBackend(redis_url, prefix="test:")
+        opened.append(backend)
+        return backend
+
+    yield connect
+    for backend in opened:
+        backend.close()
+
+
+def test_lease_is_exclusive_renewable_and_expires(backends):
+    first, second = backends(), backends()
+
+    assert first.acquire_lease("scheduler", "a", 1)
+    assert not second.acquire_lease("scheduler", "b", 1)
+    time.sleep(0.6)
+    # renewing pushes the expiry out again
+    assert first.acquire_lease("scheduler", "a", 1)
+    time.sleep(0.6)
+    assert not second.acquire_lease("scheduler", "b", 1)
+    time.sleep(0.5)
+    assert second.acquire_lease("scheduler", "b", 1)
+    assert not first.acquire_lease("scheduler", "a", 1)
+
+
+def test_lease_is_released_only_by_its_owner(backends):
+    first, second = backends(), backends()
+
+    assert first.acquire_lease("scheduler", "a", 30)
+    second.release_lease("scheduler", "b")
+    assert not second.acquire_lease("scheduler", "b", 30)
+    first.release_lease("scheduler", "a")
+    assert second.acquire_lease("scheduler", "b", 30)
+
+
+def test_expired_owner_cannot_release_or_renew_the_new_owners_lease(backends):
+    first, second = backends(), backends()
+
+    assert first.acquire_lease("scheduler", "a", 0.2)
+    time.sleep(0.3)
+    assert second.acquire_lease("scheduler", "b", 30)
+    first.release_lease("scheduler", "a")
+    assert not first.acquire_lease("scheduler", "a", 30)
+    assert second.client.execute("GET", "test:lease:scheduler") == b"b"
+
+
+@pytest.mark.parametrize("action", ["release", "renew"])
+def test_lease_taken_over_during_release_or_renewal_stays_with_new_owner(
+    backends, monkeypatch, action
+):
+    first, second = backends(), backends()
+    key = "test:lease:scheduler"
+    assert first.acquire_lease("scheduler", "a", 30)
+    execute = first.client.execute
+
+    def racing(*args):
+        reply = execute(*args)
+        if args[0] in ("GET", "EVAL"):
+            # right after the ownership check the lease expires and is taken
+            monkeypatch.setattr(first.client, "execute", execute)
+            second.client.execute("DEL", key)
+            assert second.acquire_lease("scheduler", "b", 30)
+        return reply
+
+    monkeypatch.setattr(first.client, "execute", racing)
+    if action == "release":
+        first.release_lease("scheduler", "a")
+    else:
+        first.acquire_lease("scheduler", "a", 30)
+
+    assert second.client.execute("GET", key) == b"b"
+    assert not first.acquire_lease("scheduler", "a", 30)
+
+
+def test_job_queue_is_fifo_and_shared(backends):
+    producer, consumer = backends(), backends()
+
+    for job in ("one", "two", "three"):
+        producer.push_job("generation", job)
+
+    assert [consumer.pop_job("generation") for _ in range(3)] == ["one", "two", "three"]
+
+
+def test_pop_job_waits_for_a_push_and_times_out(backends):
+    producer, consumer = backends(), backends()
+
+    started = time.monotonic()
+    assert consumer.pop_job("generation", timeout=1) is None
+    assert time.monotonic() - started >= 0.9
+
+    threading.Timer(0.2, producer.push_job, ("generation", "late")).start()
+    started = time.monotonic()
+    assert consumer.pop_job("generation", timeout=5) == "late"
+    assert time.monotonic() - started < 2
+
+
+def test_json_version_changes_on_rewrites_with_the_same_mtime(tmp_path):
+    backend = FileBackend(str(tmp_path / "bot.db"), str(tmp_path))
+    path = backend.json_path("cache")
+
+    backend.save_json("cache", {"sign": "leo"})
+    mtime = os.stat(path).st_mtime_ns
+    first = backend.json_version("cache")
+    backend.save_json("cache", {"sign": "lev"})
+    # a rewrite within the timestamp granularity, same size
+    os.utime(path, ns=(mtime, mtime))
+    second = backend.json_version("cache")
+    backend.close()
+
+    assert first is not None
+    assert second != first
+    assert backend.json_version("missing") is None
@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+
+import storage
+
+
+def test_round_trip_keeps_the_previous_version_as_backup(tmp_path):
+    path = str(tmp_path / "state.json")
+
+    storage.write_json(path, {"day": 1})
+    storage.write_json(path, {"day": 2, "text": "Овен"})
+
+    assert storage.read_json(path, None) == {"day": 2, "text": "Овен"}
+    assert storage.read_json(storage.backup_path(path), None) == {"day": 1}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_truncated_primary_falls_back_to_backup(tmp_path):
+    path = str(tmp_path / "state.json")
+    storage.write_json(path, {"day": 1})
+    storage.write_json(path, {"day": 2})
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    with open(path, "wb") as f:
+        f.write(raw[: len(raw) - 3])
+
+    assert storage.read_json(path, None) == {"day": 1}
+
+
+def test_checksum_mismatch_is_detected(tmp_path):
+    raw = storage.encode({"sign": "leo", "count": 10})
+    # same length, different payload
+    tampered = raw.replace(b'"count":10', b'"count":99')
+
+    assert storage.decode(raw) == {"sign": "leo", "count": 10}
+    with pytest.raises(storage.CorruptFileError, match="checksum"):
+        storage.decode(tampered)
+
+    path = str(tmp_path / "state.json")
+    storage.write_json(path, {"sign": "leo", "count": 1})
+    storage.write_json(path, {"sign": "leo", "count": 10})
+    with open(path, "wb") as f:
+        f.write(tampered)
+    assert storage.read_json(path, None) == {"sign": "leo", "count": 1}
+
+
+def test_damaged_file_without_backup_returns_default(tmp_path):
+    path = str(tmp_path / "state.json")
+    with open(path, "w") as f:
+        f.write('{"day": ')
+
+    assert storage.read_json(path, {"empty": True}) == {"empty": True}
+
+
+def test_legacy_file_without_header_still_loads(tmp_path):
+    path = str(tmp_path / "reminders.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"chats": [1, 2, 3]}, f, indent=2)
+
+    assert storage.read_json(path, None) == {"chats": [1, 2, 3]}
+    # the next write converts it and keeps the legacy copy as the backup
+    storage.write_json(path, {"chats": [1, 2]})
+    assert storage.read_json(path, None) == {"chats": [1, 2]}
+    assert storage.read_json(storage.backup_path(path), None) == {"chats": [1, 2, 3]}
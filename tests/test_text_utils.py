@@ -0,0 +1,54 @@
+from text_utils import TELEGRAM_MESSAGE_LIMIT, fit_telegram, utf16_len
+
+EMOJI = "♈️🌟"  # U+2648 U+FE0F are one unit each, U+1F31F is a surrogate pair
+
+
+def test_utf16_len_counts_surrogate_pairs_twice():
+    assert utf16_len("Овен") == 4
+    assert utf16_len("🌟") == 2
+    assert utf16_len(EMOJI) == 4
+
+
+def test_text_at_the_limit_is_unchanged():
+    text = "a" * (TELEGRAM_MESSAGE_LIMIT - 2) + "🌟"
+
+    assert utf16_len(text) == TELEGRAM_MESSAGE_LIMIT
+    assert fit_telegram(text) is text
+
+
+def test_surrogate_pair_across_the_limit_is_dropped_whole():
+    text = "a" * (TELEGRAM_MESSAGE_LIMIT - 1) + "🌟" + "b" * 10
+
+    fitted = fit_telegram(text)
+
+    assert fitted == "a" * (TELEGRAM_MESSAGE_LIMIT - 1)
+    assert not any(0xD800 <= ord(char) <= 0xDFFF for char in fitted)
+
+
+def test_surrogate_pair_ending_at_the_limit_is_kept():
+    text = "a" * (TELEGRAM_MESSAGE_LIMIT - 2) + "🌟" + "b" * 10
+
+    fitted = fit_telegram(text)
+
+    assert fitted == "a" * (TELEGRAM_MESSAGE_LIMIT - 2) + "🌟"
+    assert utf16_len(fitted) == TELEGRAM_MESSAGE_LIMIT
+
+
+def test_cut_ends_at_the_last_sentence_that_fits():
+    sentence = "Звёзды благосклонны 🌟. "
+    text = sentence * (TELEGRAM_MESSAGE_LIMIT // utf16_len(sentence) + 5)
+
+    fitted = fit_telegram(text)
+
+    assert fitted.endswith("🌟.")
+    assert utf16_len(fitted) <= TELEGRAM_MESSAGE_LIMIT
+    assert text.startswith(fitted)
+    assert utf16_len(fitted) > TELEGRAM_MESSAGE_LIMIT - utf16_len(sentence)
+
+
+def test_emoji_only_text_is_cut_on_a_pair_boundary():
+    text = "🌟" * 3000
+
+    fitted = fit_telegram(text)
+
+    assert fitted == "🌟" * (TELEGRAM_MESSAGE_LIMIT // 2)
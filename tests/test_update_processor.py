@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from fake_telegram import FakeBot, FakeUpdate
+from update_processor import PerChatUpdateProcessor
+
+
+def test_queued_updates_from_one_chat_do_not_block_other_chats():
+    async def scenario():
+        processor = PerChatUpdateProcessor(4)
+        bot = FakeBot()
+        finished = {}
+
+        async def work(name, seconds):
+            await asyncio.sleep(seconds)
+            finished[name] = time.monotonic()
+
+        started = time.monotonic()
+        tasks = [
+            asyncio.ensure_future(
+                processor.process_update(FakeUpdate(bot, 1, "tap"), work(("slow", n), 0.2))
+            )
+            for n in range(4)
+        ]
+        await asyncio.sleep(0)
+        await processor.process_update(FakeUpdate(bot, 2, "tap"), work("fast", 0))
+        fast = finished["fast"] - started
+        await asyncio.gather(*tasks)
+        return fast, [finished[("slow", n)] for n in range(4)]
+
+    fast, slow = asyncio.run(scenario())
+    assert fast < 0.1
+    assert slow == sorted(slow)
+
+
+def test_concurrency_is_limited_across_chats():
+    async def scenario():
+        processor = PerChatUpdateProcessor(2)
+        bot = FakeBot()
+        running = []
+        peak = []
+
+        async def work():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        await asyncio.gather(
+            *(processor.process_update(FakeUpdate(bot, chat, "tap"), work()) for chat in range(6))
+        )
+        return max(peak), processor._chat_locks
+
+    peak, locks = asyncio.run(scenario())
+    assert peak == 2
+    assert locks == {}
+
+
+def test_rejected_updates_do_not_wait_for_the_chat_lock():
+    async def scenario():
+        async def admit(update):
+            return update.message.text != "flood"
+
+        processor = PerChatUpdateProcessor(1, admit)
+        bot = FakeBot()
+        ran = []
+
+        async def work(name, seconds):
+            await asyncio.sleep(seconds)
+            ran.append(name)
+
+        slow = asyncio.ensure_future(
+            processor.process_update(FakeUpdate(bot, 1, "tap"), work("slow", 0.2))
+        )
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await processor.process_update(FakeUpdate(bot, 1, "flood"), work("flood", 0))
+        rejected = time.monotonic() - started
+        await slow
+        return rejected, ran
+
+    rejected, ran = asyncio.run(scenario())
+    assert rejected < 0.1
+    assert ran == ["slow"]
@@ -27,3 +27,32 @@ def trim_text(text: str) -> str:
     if last_punct != -1:
         truncated = truncated[: last_punct + 1]
     return truncated
+
+
+# Telegram counts message length in UTF-16 code units, not characters
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def utf16_len(text: str) -> int:
+    """Return the length of text in UTF-16 code units, as Telegram counts it."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def fit_telegram(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> str:
+    """Cut text to at most ``limit`` UTF-16 code units.
+
+    Like ``trim_text`` the cut is made after the last complete sentence
+    that fits; without one the text is cut at the limit. Characters
+    outside the BMP take two units and are never split.
+    """
+    if len(text) * 2 <= limit or utf16_len(text) <= limit:
+        return text
+    encoded = text.encode('utf-16-le')[: limit * 2]
+    if 0xD8 <= encoded[-1] <= 0xDB:
+        # drop a high surrogate whose pair fell past the limit
+        encoded = encoded[:-2]
+    truncated = encoded.decode('utf-16-le')
+    last_punct = max(truncated.rfind('.'), truncated.rfind('!'), truncated.rfind('?'))
+    if last_punct != -1:
+        truncated = truncated[: last_punct + 1]
+    return truncated
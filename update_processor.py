@@ -0,0 +1,67 @@
+"""Concurrent update processing that keeps each chat's updates in order."""
+
+import asyncio
+import sys
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process up to ``max_concurrent_updates`` updates at once.
+
+    Updates from the same chat are serialised through a per-chat lock, so a
+    user's "mode then sign" sequence is handled in the order it arrived.
+    A concurrency slot is only taken once an update holds its chat's lock:
+    updates queued behind a slow one from the same chat never occupy slots
+    other chats could use. Locks are dropped as soon as a chat has no
+    queued updates.
+
+    ``admit`` is an optional ``async (update) -> bool`` run before the chat
+    lock; updates it rejects are dropped without queueing behind the chat
+    or taking a slot.
+    """
+
+    def __init__(self, max_concurrent_updates: int, admit=None):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self._limit = max_concurrent_updates
+        self._admit = admit
+        # The base class takes its semaphore before do_process_update, i.e.
+        # before the chat lock; keep it unbounded and limit with _slots
+        # (so max_concurrent_updates reports sys.maxsize, use ``limit``)
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # chat id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks = {}
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    async def do_process_update(self, update, coroutine):
+        if self._admit is not None and not await self._admit(update):
+            coroutine.close()
+            return
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass